@@ -1,14 +1,46 @@
+import os
 import sqlite3
-from datetime import datetime, date, timedelta
-from flask import Flask, render_template, request, redirect, url_for, send_file, flash
+import time
+from datetime import date
+from flask import Flask, Response, render_template, request, redirect, url_for, send_file, flash
+from jinja2 import FileSystemBytecodeCache
+import click
 import csv
 import io
-from docx import Document
+
+import frammenti
+import modifiche
+from giorni import GIORNO_MAX, GIORNO_MIN, aggiungi_giorni, data_da_giorno, giorno_da_data, intervallo, leggi_data
+from lotti import (
+    GIORNI_AVVISO_SCADENZA,
+    GIORNI_SCADENZA_DEFAULT,
+    alloca_giorno,
+    alloca_ordine,
+    alloca_prodotto,
+    alloca_tutto,
+    scadenza_default,
+)
+from pianificazione import pianifica
+from unita import TIPI_QTA, converti_qta, sql_kg, sql_vaschette
 
 app = Flask(__name__)
 app.secret_key = "chiave-super-segreta"
 
-DB_PATH = "gestionale.db"
+DB_PATH = os.environ.get("GESTIONALE_DB", "gestionale.db")
+
+# "1" = carica subito le librerie per le stampe Word (worker dedicato alle stampe)
+PRECARICA_STAMPE = os.environ.get("GESTIONALE_PRECARICA_STAMPE") == "1"
+
+# elenchi di ordini e produzione: giorni mostrati se non si sceglie un periodo
+GIORNI_ELENCHI = 30
+
+# template già compilati salvati su disco: i worker nuovi non ricompilano
+CACHE_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_jinja")
+try:
+    os.makedirs(CACHE_TEMPLATE, exist_ok=True)
+    app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache(CACHE_TEMPLATE)}
+except OSError:
+    pass  # cartella non scrivibile: si compilano i template a ogni avvio
 
 
 # ---------------------- DB UTILS ----------------------
@@ -17,84 +49,466 @@ DB_PATH = "gestionale.db"
 def get_db_connection():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    # regole ON DELETE di SCHEMA (in SQLite vanno attivate per connessione)
+    conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
 
-def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
+def tabella_in_cache(cur, nome, tabelle, crea, *parametri):
+    """
+    Frammento HTML `nome` dalla cache (vedi frammenti.py), rigenerato con
+    crea() solo se una delle `tabelle` è cambiata.
+    """
+    return frammenti.frammento(nome, frammenti.versione(cur, tabelle), crea, (DB_PATH, *parametri))
+
+
+def _aggiungi_colonna(cur, tabella, colonna, definizione):
+    """
+    Aggiunge una colonna a una tabella esistente se non c'è ancora.
+    Ritorna True se la colonna è stata aggiunta.
+    """
+    cur.execute(f"PRAGMA table_info({tabella})")
+    if any(r["name"] == colonna for r in cur.fetchall()):
+        return False
+    cur.execute(f"ALTER TABLE {tabella} ADD COLUMN {colonna} {definizione}")
+    return True
+
+
+# ---------------------- SCHEMA ----------------------
 
+# Regole sulle cancellazioni: le righe seguono la loro testata (CASCADE);
+# clienti, prodotti e lotti usati da altri dati non si possono cancellare
+# (RESTRICT). Valgono perché get_db_connection attiva PRAGMA foreign_keys.
+SCHEMA = {
     # CLIENTI
-    cur.execute(
-        """
+    "clienti": """
         CREATE TABLE IF NOT EXISTS clienti (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             codice TEXT,
             nome TEXT NOT NULL UNIQUE
         )
-        """
-    )
-
+    """,
     # PRODOTTI
-    cur.execute(
-        """
+    "prodotti": """
         CREATE TABLE IF NOT EXISTS prodotti (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             codice TEXT,
             nome TEXT NOT NULL UNIQUE,
             kg_per_vaschetta REAL NOT NULL,
-            giacenza_iniziale_vaschette REAL NOT NULL DEFAULT 0
+            giacenza_iniziale_vaschette REAL NOT NULL DEFAULT 0,
+            kg_ora REAL, -- capacità di produzione (kg/ora), per la pianificazione
+            giorni_scadenza INTEGER -- vita del prodotto; vuoto = lotti.GIORNI_SCADENZA_DEFAULT
         )
-        """
-    )
-
+    """,
     # ORDINI (testata)
-    cur.execute(
-        """
+    "ordini": """
         CREATE TABLE IF NOT EXISTS ordini (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             data TEXT NOT NULL,
+            giorno INTEGER,
             cliente_id INTEGER NOT NULL,
-            FOREIGN KEY (cliente_id) REFERENCES clienti(id)
+            modello_id INTEGER, -- modello da cui è stato generato (se c'è)
+            FOREIGN KEY (cliente_id) REFERENCES clienti(id) ON DELETE RESTRICT,
+            FOREIGN KEY (modello_id) REFERENCES modelli_ordine(id) ON DELETE SET NULL
         )
-        """
-    )
-
+    """,
     # RIGHE ORDINE (dettaglio)
-    cur.execute(
-        """
+    "righe_ordine": """
         CREATE TABLE IF NOT EXISTS righe_ordine (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             ordine_id INTEGER NOT NULL,
             prodotto_id INTEGER NOT NULL,
             qta_inserita REAL NOT NULL,
             tipo_qta TEXT NOT NULL,
-            FOREIGN KEY (ordine_id) REFERENCES ordini(id),
-            FOREIGN KEY (prodotto_id) REFERENCES prodotti(id)
+            kg REAL,
+            vaschette REAL,
+            da_allocare_v REAL, -- vaschette non ancora coperte da lotti
+            FOREIGN KEY (ordine_id) REFERENCES ordini(id) ON DELETE CASCADE,
+            FOREIGN KEY (prodotto_id) REFERENCES prodotti(id) ON DELETE RESTRICT
         )
-        """
-    )
-
+    """,
     # PRODUZIONE
-    cur.execute(
-        """
+    "produzione": """
         CREATE TABLE IF NOT EXISTS produzione (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             data TEXT NOT NULL,
+            giorno INTEGER,
             prodotto_id INTEGER NOT NULL,
             vaschette_prodotte REAL NOT NULL,
-            FOREIGN KEY (prodotto_id) REFERENCES prodotti(id)
+            lotto TEXT,
+            scadenza TEXT,
+            scadenza_giorno INTEGER,
+            residuo_v REAL, -- vaschette del lotto non ancora assegnate a ordini
+            FOREIGN KEY (prodotto_id) REFERENCES prodotti(id) ON DELETE RESTRICT
         )
+    """,
+    # ALLOCAZIONI (quote di lotto assegnate alle righe d'ordine)
+    "allocazioni": """
+        CREATE TABLE IF NOT EXISTS allocazioni (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            riga_ordine_id INTEGER NOT NULL,
+            produzione_id INTEGER NOT NULL,
+            vaschette REAL NOT NULL,
+            FOREIGN KEY (riga_ordine_id) REFERENCES righe_ordine(id) ON DELETE CASCADE,
+            FOREIGN KEY (produzione_id) REFERENCES produzione(id) ON DELETE RESTRICT
+        )
+    """,
+    # MODELLI D'ORDINE (ordini fissi per cliente)
+    "modelli_ordine": """
+        CREATE TABLE IF NOT EXISTS modelli_ordine (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cliente_id INTEGER NOT NULL,
+            nome TEXT NOT NULL,
+            ricorrente INTEGER NOT NULL DEFAULT 0, -- 1 = generato in blocco ogni giorno
+            FOREIGN KEY (cliente_id) REFERENCES clienti(id) ON DELETE CASCADE
+        )
+    """,
+    "righe_modello": """
+        CREATE TABLE IF NOT EXISTS righe_modello (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            modello_id INTEGER NOT NULL,
+            prodotto_id INTEGER NOT NULL,
+            qta_inserita REAL NOT NULL,
+            tipo_qta TEXT NOT NULL,
+            FOREIGN KEY (modello_id) REFERENCES modelli_ordine(id) ON DELETE CASCADE,
+            FOREIGN KEY (prodotto_id) REFERENCES prodotti(id) ON DELETE RESTRICT
+        )
+    """,
+    # LINEE DI PRODUZIONE (capacità giornaliera)
+    "linee_produzione": """
+        CREATE TABLE IF NOT EXISTS linee_produzione (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL UNIQUE,
+            ore_giorno REAL NOT NULL
+        )
+    """,
+}
+
+# togliere un'assegnazione (anche in cascata con la riga d'ordine)
+# restituisce le vaschette al lotto
+TRIGGER_RILASCIO = """
+    CREATE TRIGGER IF NOT EXISTS allocazioni_rilascio
+    AFTER DELETE ON allocazioni
+    BEGIN
+        UPDATE produzione SET residuo_v = residuo_v + OLD.vaschette
+        WHERE id = OLD.produzione_id;
+    END
+"""
+
+
+def _chiavi_esterne(cur, tabella):
+    cur.execute(f"PRAGMA foreign_key_list({tabella})")
+    return sorted((r["table"], r["from"], r["to"], r["on_delete"]) for r in cur.fetchall())
+
+
+def _chiavi_esterne_attese():
+    """Chiavi esterne di ogni tabella come definite in SCHEMA."""
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    for sql in SCHEMA.values():
+        cur.execute(sql)
+    attese = {tabella: _chiavi_esterne(cur, tabella) for tabella in SCHEMA}
+    conn.close()
+    return attese
+
+
+def _ricrea_tabella(cur, tabella):
+    """
+    Ricrea `tabella` con la definizione di SCHEMA (SQLite non permette di
+    cambiare le chiavi esterne con ALTER TABLE), copiando i dati e tenendo
+    il contatore AUTOINCREMENT, così gli id cancellati non vengono riusati.
+    Va chiamata con PRAGMA foreign_keys = OFF; gli indici della tabella
+    vanno ricreati dopo.
+    """
+    cur.execute(f"PRAGMA table_info({tabella})")
+    colonne = ", ".join(r["name"] for r in cur.fetchall())
+    cur.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (tabella,))
+    contatore = cur.fetchone()
+
+    cur.execute(SCHEMA[tabella].replace(f"IF NOT EXISTS {tabella} (", f"{tabella}_nuova (", 1))
+    cur.execute(f"INSERT INTO {tabella}_nuova ({colonne}) SELECT {colonne} FROM {tabella}")
+    cur.execute(f"DROP TABLE {tabella}")
+    cur.execute(f"ALTER TABLE {tabella}_nuova RENAME TO {tabella}")
+    if contatore is not None:
+        cur.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (contatore["seq"], tabella))
+
+
+def _elimina_orfani(cur):
+    """
+    Dopo aver attivato le regole: le righe che puntano a dati già
+    cancellati vengono trattate come se la regola ci fosse stata
+    (CASCADE le cancella, SET NULL svuota il riferimento). Le violazioni di
+    RESTRICT non si possono sistemare da sole e vengono solo segnalate.
+    """
+    regole = {}
+    while True:
+        cur.execute("PRAGMA foreign_key_check")
+        violazioni = cur.fetchall()
+        sistemate = 0
+        for tabella, rowid, _, fkid in violazioni:
+            if tabella not in regole:
+                cur.execute(f"PRAGMA foreign_key_list({tabella})")
+                regole[tabella] = {r["id"]: (r["from"], r["on_delete"]) for r in cur.fetchall()}
+            colonna, azione = regole[tabella][fkid]
+            if azione == "CASCADE":
+                cur.execute(f"DELETE FROM {tabella} WHERE rowid = ?", (rowid,))
+            elif azione == "SET NULL":
+                cur.execute(f"UPDATE {tabella} SET {colonna} = NULL WHERE rowid = ?", (rowid,))
+            else:
+                continue
+            sistemate += 1
+
+        # una cancellazione può lasciare orfane altre righe: si ricontrolla
+        if not sistemate:
+            if violazioni:
+                app.logger.warning(
+                    "%d righe collegate a dati inesistenti (PRAGMA foreign_key_check).",
+                    len(violazioni),
+                )
+            return
+
+
+def _migra_chiavi_esterne(cur):
+    """
+    Ricrea le tabelle le cui chiavi esterne non sono quelle di SCHEMA.
+    Ritorna True se ne ha ricreata qualcuna: le righe orfane vanno poi
+    tolte con _elimina_orfani.
+    """
+    attese = _chiavi_esterne_attese()
+    da_ricreare = [t for t in SCHEMA if _chiavi_esterne(cur, t) != attese[t]]
+    if not da_ricreare:
+        return False
+
+    # il trigger cita produzione: va tolto mentre le tabelle vengono sostituite
+    cur.execute("DROP TRIGGER IF EXISTS allocazioni_rilascio")
+    for tabella in da_ricreare:
+        _ricrea_tabella(cur, tabella)
+    cur.execute(TRIGGER_RILASCIO)
+    return True
+
+
+def init_db():
+    conn = get_db_connection()
+    # durante le migrazioni le tabelle possono essere ricreate: i vincoli
+    # vengono controllati dopo (_elimina_orfani)
+    conn.execute("PRAGMA foreign_keys = OFF")
+    cur = conn.cursor()
+
+    for sql in SCHEMA.values():
+        cur.execute(sql)
+    cur.execute(TRIGGER_RILASCIO)
+
+    # REGISTRO MODIFICHE (sincronizzazione contabilità)
+    modifiche.crea_tabella(cur)
+
+    # ---- MIGRAZIONI ----
+    # i trigger del registro vengono tolti durante le migrazioni (i backfill
+    # non sono modifiche di dati) e ricreati alla fine sullo schema aggiornato
+    modifiche.elimina_trigger(cur)
+    # tabelle i cui dati sincronizzati sono stati cambiati da un backfill:
+    # alla fine le loro righe già registrate vengono riscritte nel registro
+    cambiate = set()
+
+    # righe_ordine: kg e vaschette normalizzati al momento dell'inserimento
+    _aggiungi_colonna(cur, "righe_ordine", "kg", "REAL")
+    _aggiungi_colonna(cur, "righe_ordine", "vaschette", "REAL")
+    cur.execute(
+        f"""
+        UPDATE righe_ordine
+        SET kg = (
+                SELECT {sql_kg("righe_ordine.qta_inserita", "righe_ordine.tipo_qta", "p.kg_per_vaschetta")}
+                FROM prodotti p WHERE p.id = righe_ordine.prodotto_id
+            ),
+            vaschette = (
+                SELECT {sql_vaschette("righe_ordine.qta_inserita", "righe_ordine.tipo_qta", "p.kg_per_vaschetta")}
+                FROM prodotti p WHERE p.id = righe_ordine.prodotto_id
+            )
+        WHERE kg IS NULL OR vaschette IS NULL
+        """
+    )
+    if cur.rowcount:
+        cambiate.add("righe_ordine")
+
+    # ordini/produzione: chiave intera del giorno (AAAAMMGG) per i filtri per data
+    for tabella in ("ordini", "produzione"):
+        _aggiungi_colonna(cur, tabella, "giorno", "INTEGER")
+        cur.execute(
+            f"""
+            UPDATE {tabella}
+            SET giorno = CAST(strftime('%Y%m%d', data) AS INTEGER),
+                data = date(data)
+            WHERE giorno IS NULL AND date(data) IS NOT NULL
+            """
+        )
+        if cur.rowcount:
+            cambiate.add(tabella)
+        # date illeggibili: senza giorno la riga non compare nei filtri per data
+        cur.execute(f"SELECT id, data FROM {tabella} WHERE giorno IS NULL ORDER BY id")
+        senza_giorno = cur.fetchall()
+        if senza_giorno:
+            app.logger.warning(
+                "%s: %d righe con data non valida, escluse dai filtri per data "
+                "finché la data non viene corretta (AAAA-MM-GG): %s",
+                tabella,
+                len(senza_giorno),
+                ", ".join(f"id {r['id']} ({r['data']!r})" for r in senza_giorno[:20]),
+            )
+
+    # ordini: modello d'origine, per non generare due volte lo stesso ordine fisso
+    _aggiungi_colonna(cur, "ordini", "modello_id", "INTEGER")
+
+    # prodotti: capacità kg/ora per la pianificazione
+    _aggiungi_colonna(cur, "prodotti", "kg_ora", "REAL")
+
+    # lotti: numero, scadenza e residuo per le produzioni già registrate
+    _aggiungi_colonna(cur, "prodotti", "giorni_scadenza", "INTEGER")
+    for colonna, definizione in (
+        ("lotto", "TEXT"),
+        ("scadenza", "TEXT"),
+        ("scadenza_giorno", "INTEGER"),
+        ("residuo_v", "REAL"),
+    ):
+        _aggiungi_colonna(cur, "produzione", colonna, definizione)
+    lotti_prima = conn.total_changes
+    cur.execute(
+        f"""
+        UPDATE produzione
+        SET scadenza = date(data, '+' || COALESCE(
+                (SELECT giorni_scadenza FROM prodotti p WHERE p.id = produzione.prodotto_id),
+                {GIORNI_SCADENZA_DEFAULT}) || ' days')
+        WHERE scadenza IS NULL AND date(data) IS NOT NULL
         """
     )
+    cur.execute(
+        """
+        UPDATE produzione
+        SET scadenza_giorno = CAST(strftime('%Y%m%d', scadenza) AS INTEGER)
+        WHERE scadenza_giorno IS NULL AND scadenza IS NOT NULL
+        """
+    )
+    cur.execute("UPDATE produzione SET lotto = 'L' || COALESCE(giorno, '') || '-' || id WHERE lotto IS NULL")
+    if conn.total_changes != lotti_prima:
+        cambiate.add("produzione")
+    cur.execute("UPDATE produzione SET residuo_v = vaschette_prodotte WHERE residuo_v IS NULL")
+
+    # righe d'ordine non ancora passate dall'assegnazione: si assegnano
+    # subito, dalla consegna più vecchia, così i residui dei lotti sono veri
+    _aggiungi_colonna(cur, "righe_ordine", "da_allocare_v", "REAL")
+    cur.execute("UPDATE righe_ordine SET da_allocare_v = vaschette WHERE da_allocare_v IS NULL")
+    righe_da_assegnare = cur.rowcount
+
+    # regole ON DELETE sulle chiavi esterne (database creati prima)
+    chiavi_migrate = _migra_chiavi_esterne(cur)
+
+    # ---- INDICI ----
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ordini_cliente ON ordini(cliente_id, giorno)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ordini_modello ON ordini(modello_id, giorno)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_modelli_cliente ON modelli_ordine(cliente_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_righe_modello_modello ON righe_modello(modello_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_righe_modello_prodotto ON righe_modello(prodotto_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ordini_giorno ON ordini(giorno)")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_lotti_aperti "
+        "ON produzione(prodotto_id, scadenza_giorno, id) WHERE residuo_v > 0"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_lotti_in_scadenza "
+        "ON produzione(scadenza_giorno) WHERE residuo_v > 0"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_righe_da_allocare "
+        "ON righe_ordine(prodotto_id) WHERE da_allocare_v > 0"
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_allocazioni_riga ON allocazioni(riga_ordine_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_allocazioni_produzione ON allocazioni(produzione_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_produzione_giorno ON produzione(giorno)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_righe_ordine_ordine ON righe_ordine(ordine_id)")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_righe_ordine_prodotto "
+        "ON righe_ordine(prodotto_id, vaschette)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_produzione_prodotto "
+        "ON produzione(prodotto_id, vaschette_prodotte)"
+    )
+
+    # ---- TRIGGER ----
+    modifiche.crea_trigger(cur)
+    # righe precedenti al registro e quelle toccate dalle migrazioni
+    modifiche.registra_esistenti(cur, cambiate)
+    # con i trigger attivi: le righe orfane tolte o svuotate finiscono nel
+    # registro come 'D'/'U', e la contabilità le toglie anche dalla sua copia
+    if chiavi_migrate:
+        _elimina_orfani(cur)
+
+    # le assegnazioni toccano solo residui esclusi dal registro
+    if righe_da_assegnare:
+        alloca_tutto(cur)
 
     conn.commit()
     conn.close()
 
 
+# ---------------------- DOCUMENTI WORD ----------------------
+
+
+def nuovo_documento():
+    """
+    Crea un documento Word vuoto. python-docx (e lxml) viene importato solo
+    qui, alla prima stampa, così l'avvio dei worker resta leggero.
+    """
+    from docx import Document
+
+    return Document()
+
+
+def precarica_librerie_stampa():
+    """Importa python-docx (con il template di default) e reportlab in anticipo."""
+    nuovo_documento()
+    import etichette  # noqa: F401
+
+
+if PRECARICA_STAMPE:
+    precarica_librerie_stampa()
+
+
 # ---------------------- FUNZIONI LOGICHE ----------------------
 
 
+def data_da_form(valore):
+    """
+    Valida una data arrivata da form o querystring (AAAA-MM-GG).
+    Ritorna (data_iso, giorno) oppure None se non valida; se vuota usa oggi.
+    """
+    if not valore:
+        d = date.today()
+    else:
+        try:
+            d = leggi_data(valore)
+        except ValueError:
+            return None
+    return d.isoformat(), giorno_da_data(d)
+
+
+def periodo_elenco():
+    """
+    Periodo (dal, al, giorno_inizio, giorno_fine) di un elenco dalla
+    querystring. Senza `dal` si parte da GIORNI_ELENCHI giorni fa, così
+    l'elenco non rilegge tutto lo storico; un `dal` vuoto lo mostra tutto.
+    """
+    recenti = date.fromordinal(date.today().toordinal() - GIORNI_ELENCHI).isoformat()
+    dal = request.args.get("dal", recenti)
+    al = request.args.get("al", "")
+    try:
+        giorno_inizio, giorno_fine = intervallo(dal, al)
+    except ValueError:
+        flash("Intervallo di date non valido (formato AAAA-MM-GG).", "danger")
+        dal, al = recenti, ""
+        giorno_inizio, giorno_fine = intervallo(dal, al)
+    return dal, al, giorno_inizio, giorno_fine
+
+
 def calcola_magazzino():
     """
     Calcola la giacenza per ogni prodotto, in vaschette e in kg.
@@ -102,35 +516,25 @@ def calcola_magazzino():
     conn = get_db_connection()
     cur = conn.cursor()
 
-    cur.execute("SELECT * FROM prodotti ORDER BY nome")
+    cur.execute(
+        """
+        SELECT p.*,
+               COALESCE((SELECT SUM(pr.vaschette_prodotte) FROM produzione pr
+                         WHERE pr.prodotto_id = p.id), 0) AS prodotte,
+               COALESCE((SELECT SUM(ro.vaschette) FROM righe_ordine ro
+                         WHERE ro.prodotto_id = p.id), 0) AS ordinate_v
+        FROM prodotti p
+        ORDER BY p.nome
+        """
+    )
     prodotti = cur.fetchall()
 
     magazzino = []
 
     for p in prodotti:
         pid = p["id"]
-
-        # produzione totale (vaschette)
-        cur.execute(
-            "SELECT COALESCE(SUM(vaschette_prodotte), 0) FROM produzione WHERE prodotto_id = ?",
-            (pid,),
-        )
-        prodotte = cur.fetchone()[0] or 0
-
-        # ordini totali (convertiti in vaschette)
-        cur.execute(
-            "SELECT qta_inserita, tipo_qta FROM righe_ordine WHERE prodotto_id = ?",
-            (pid,),
-        )
-        righe = cur.fetchall()
-
-        ordinate_v = 0
-        for r in righe:
-            if r["tipo_qta"] == "v":
-                ordinate_v += r["qta_inserita"]
-            else:
-                if p["kg_per_vaschetta"] > 0:
-                    ordinate_v += r["qta_inserita"] / p["kg_per_vaschetta"]
+        prodotte = p["prodotte"]
+        ordinate_v = p["ordinate_v"]
 
         giac_finale_v = p["giacenza_iniziale_vaschette"] + prodotte - ordinate_v
         giac_finale_kg = giac_finale_v * p["kg_per_vaschetta"]
@@ -202,9 +606,9 @@ def elimina_cliente(id):
     conn = get_db_connection()
     cur = conn.cursor()
 
-    # controllo ordini collegati
-    cur.execute("SELECT COUNT(*) FROM ordini WHERE cliente_id = ?", (id,))
-    if cur.fetchone()[0] > 0:
+    # controllo ordini collegati (i suoi modelli d'ordine vengono cancellati con lui)
+    cur.execute("SELECT EXISTS (SELECT 1 FROM ordini WHERE cliente_id = ?)", (id,))
+    if cur.fetchone()[0]:
         flash("Impossibile eliminare: cliente con ordini esistenti.", "danger")
         conn.close()
         return redirect(url_for("clienti"))
@@ -268,14 +672,17 @@ def elimina_prodotto(id):
     conn = get_db_connection()
     cur = conn.cursor()
 
-    # controllo movimenti collegati
-    cur.execute("SELECT COUNT(*) FROM righe_ordine WHERE prodotto_id = ?", (id,))
-    cnt1 = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM produzione WHERE prodotto_id = ?", (id,))
-    cnt2 = cur.fetchone()[0]
-
-    if cnt1 + cnt2 > 0:
-        flash("Impossibile eliminare: il prodotto ha movimenti registrati.", "danger")
+    # controllo movimenti e modelli collegati
+    cur.execute(
+        """
+        SELECT EXISTS (SELECT 1 FROM righe_ordine WHERE prodotto_id = ?)
+            OR EXISTS (SELECT 1 FROM produzione WHERE prodotto_id = ?)
+            OR EXISTS (SELECT 1 FROM righe_modello WHERE prodotto_id = ?)
+        """,
+        (id, id, id),
+    )
+    if cur.fetchone()[0]:
+        flash("Impossibile eliminare: il prodotto ha movimenti registrati o è in un modello d'ordine.", "danger")
     else:
         cur.execute("DELETE FROM prodotti WHERE id = ?", (id,))
         conn.commit()
@@ -289,31 +696,41 @@ def elimina_prodotto(id):
 
 @app.route("/ordini")
 def lista_ordini():
+    dal, al, giorno_inizio, giorno_fine = periodo_elenco()
+
     conn = get_db_connection()
     cur = conn.cursor()
+    tabella = tabella_in_cache(
+        cur,
+        "ordini",
+        ("ordini", "righe_ordine", "clienti"),
+        lambda: _tabella_ordini(cur, giorno_inizio, giorno_fine),
+        giorno_inizio,
+        giorno_fine,
+    )
+    cur.execute("SELECT id, nome FROM clienti ORDER BY nome")
+    clienti = cur.fetchall()
+    conn.close()
+    return render_template("ordini.html", tabella=tabella, clienti=clienti, dal=dal, al=al)
+
+
+def _tabella_ordini(cur, giorno_inizio, giorno_fine):
     cur.execute("""
         SELECT 
             o.id AS id,
             o.data,
             c.nome AS cliente_nome,
             c.codice AS cliente_codice,
-            COUNT(ro.id) AS num_righe,
-            SUM(
-                CASE 
-                    WHEN ro.tipo_qta = 'kg' THEN ro.qta_inserita
-                    ELSE ro.qta_inserita * p.kg_per_vaschetta
-                END
-            ) AS kg_totali
+            (SELECT COUNT(*) FROM righe_ordine ro WHERE ro.ordine_id = o.id) AS num_righe,
+            (SELECT COALESCE(SUM(ro.kg), 0) FROM righe_ordine ro WHERE ro.ordine_id = o.id) AS kg_totali
         FROM ordini o
         JOIN clienti c ON c.id = o.cliente_id
-        JOIN righe_ordine ro ON ro.ordine_id = o.id
-        JOIN prodotti p ON p.id = ro.prodotto_id
-        GROUP BY o.id, o.data, c.nome, c.codice
-        ORDER BY o.data DESC, o.id DESC
-    """)
-    ordini = cur.fetchall()
-    conn.close()
-    return render_template("ordini.html", ordini=ordini)
+        -- il periodo è un intervallo su idx_ordini_giorno, che dà già
+        -- l'ordinamento; le righe si sommano per ordine da idx_righe_ordine_ordine
+        WHERE o.giorno BETWEEN ? AND ?
+        ORDER BY o.giorno DESC, o.id DESC
+    """, (giorno_inizio, giorno_fine))
+    return render_template("frammenti/ordini.html", ordini=cur.fetchall())
 
 
 @app.route("/ordini/nuovo", methods=["GET", "POST"])
@@ -322,23 +739,28 @@ def nuovo_ordine():
     cur = conn.cursor()
 
     if request.method == "POST":
-        data_str = request.form.get("data") or datetime.today().strftime("%Y-%m-%d")
+        data = data_da_form(request.form.get("data"))
         cliente_id = request.form.get("cliente_id")
 
+        if data is None:
+            flash("Data non valida (formato AAAA-MM-GG).", "danger")
+            conn.close()
+            return redirect(url_for("nuovo_ordine"))
+
         if not cliente_id:
             flash("Seleziona un cliente.", "danger")
             conn.close()
             return redirect(url_for("nuovo_ordine"))
 
-        # crea testata ordine
-        cur.execute(
-            "INSERT INTO ordini (data, cliente_id) VALUES (?, ?)",
-            (data_str, cliente_id),
-        )
-        ordine_id = cur.lastrowid
+        # il cliente può essere stato eliminato mentre il modulo era aperto
+        cur.execute("SELECT 1 FROM clienti WHERE id = ?", (cliente_id,))
+        if cur.fetchone() is None:
+            flash("Cliente non trovato.", "danger")
+            conn.close()
+            return redirect(url_for("nuovo_ordine"))
 
         # righe ordine (10 righe massimo fisse, semplici)
-        righe_ok = 0
+        righe_form = []
         for index in range(10):
             prod_id = request.form.get(f"prodotto_{index}")
             qta_str = request.form.get(f"qta_{index}", "").replace(",", ".")
@@ -358,24 +780,45 @@ def nuovo_ordine():
             if qta <= 0:
                 continue
 
-            if tipo not in ("kg", "v"):
+            if tipo not in TIPI_QTA:
                 continue
 
-            cur.execute(
-                "INSERT INTO righe_ordine (ordine_id, prodotto_id, qta_inserita, tipo_qta) "
-                "VALUES (?, ?, ?, ?)",
-                (ordine_id, prod_id, qta, tipo),
-            )
-            righe_ok += 1
+            righe_form.append((prod_id, qta, tipo))
 
-        if righe_ok == 0:
-            # nessuna riga valida -> cancello l’ordine
-            cur.execute("DELETE FROM ordini WHERE id = ?", (ordine_id,))
-            conn.commit()
+        # kg/vaschetta di tutti i prodotti dell'ordine in una sola query
+        ids = sorted({r[0] for r in righe_form})
+        cur.execute(
+            f"SELECT id, kg_per_vaschetta FROM prodotti WHERE id IN ({', '.join('?' * len(ids))})",
+            ids,
+        )
+        kg_v = {str(r["id"]): r["kg_per_vaschetta"] for r in cur.fetchall()}
+        righe_form = [r for r in righe_form if r[0] in kg_v]
+
+        if not righe_form:
             conn.close()
             flash("Nessuna riga valida inserita.", "danger")
             return redirect(url_for("nuovo_ordine"))
 
+        # crea testata ordine
+        data_str, giorno = data
+        cur.execute(
+            "INSERT INTO ordini (data, giorno, cliente_id) VALUES (?, ?, ?)",
+            (data_str, giorno, cliente_id),
+        )
+        ordine_id = cur.lastrowid
+
+        righe_ins = []
+        for prod_id, qta, tipo in righe_form:
+            kg, vaschette = converti_qta(qta, tipo, kg_v[prod_id])
+            righe_ins.append((ordine_id, prod_id, qta, tipo, kg, vaschette, vaschette))
+
+        cur.executemany(
+            "INSERT INTO righe_ordine (ordine_id, prodotto_id, qta_inserita, tipo_qta, kg, vaschette, da_allocare_v) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            righe_ins,
+        )
+        alloca_ordine(cur, ordine_id)
+
         conn.commit()
         conn.close()
         flash("Ordine salvato correttamente.", "success")
@@ -413,11 +856,10 @@ def dettaglio_ordine(ordine_id):
 
     cur.execute("""
         SELECT ro.id,
-               ro.qta_inserita,
-               ro.tipo_qta,
+               ro.kg,
+               ro.vaschette,
                p.nome AS prodotto_nome,
-               p.codice AS prodotto_codice,
-               p.kg_per_vaschetta
+               p.codice AS prodotto_codice
         FROM righe_ordine ro
         JOIN prodotti p ON p.id = ro.prodotto_id
         WHERE ro.ordine_id = ?
@@ -431,16 +873,8 @@ def dettaglio_ordine(ordine_id):
     tot_v = 0.0
 
     for r in righe:
-        q = r["qta_inserita"]
-        t = r["tipo_qta"]
-        kg_v = r["kg_per_vaschetta"] or 0
-
-        if t == "kg":
-            kg = q
-            v = q / kg_v if kg_v else 0
-        else:  # vaschette
-            v = q
-            kg = q * kg_v
+        kg = r["kg"]
+        v = r["vaschette"]
 
         tot_kg += kg
         tot_v += v
@@ -463,15 +897,276 @@ def dettaglio_ordine(ordine_id):
 
 @app.route("/ordini/<int:ordine_id>/elimina", methods=["POST"])
 def elimina_ordine(ordine_id):
+    conn = get_db_connection()
+    # righe e assegnazioni dei lotti vanno via in cascata (le vaschette
+    # tornano ai lotti con il trigger allocazioni_rilascio)
+    with conn:
+        conn.execute("DELETE FROM ordini WHERE id = ?", (ordine_id,))
+    conn.close()
+    flash("Ordine eliminato.", "info")
+    return redirect(url_for("lista_ordini"))
+
+
+@app.route("/ordini/elimina_blocco", methods=["POST"])
+def elimina_ordini_blocco():
+    """Elimina in un colpo gli ordini di un periodo e/o di un cliente."""
+    dal = request.form.get("dal", "")
+    al = request.form.get("al", "")
+    cliente_id = request.form.get("cliente_id", type=int)
+    try:
+        giorno_inizio, giorno_fine = intervallo(dal, al)
+    except ValueError:
+        flash("Intervallo di date non valido (formato AAAA-MM-GG).", "danger")
+        return redirect(url_for("lista_ordini"))
+
+    if not (dal or al or cliente_id):
+        flash("Indica un periodo o un cliente: non si eliminano tutti gli ordini.", "danger")
+        return redirect(url_for("lista_ordini"))
+
+    filtro = "giorno BETWEEN ? AND ?"
+    params = [giorno_inizio, giorno_fine]
+    if cliente_id:
+        filtro += " AND cliente_id = ?"
+        params.append(cliente_id)
+
+    conn = get_db_connection()
+    # un'unica transazione: righe e assegnazioni seguono in cascata
+    with conn:
+        eliminati = conn.execute(f"DELETE FROM ordini WHERE {filtro}", params).rowcount
+    conn.close()
+    flash(f"Eliminati {eliminati} ordini.", "info")
+    return redirect(url_for("lista_ordini"))
+
+
+# ---------------------- MODELLI E RIPETIZIONE ORDINI ----------------------
+
+# righe copiate con INSERT ... SELECT: kg e vaschette ricalcolati con il
+# kg/vaschetta attuale del prodotto, tutte ancora da coprire con i lotti
+_COLONNE_RIGA_COPIATA = f"""
+    src.prodotto_id,
+    src.qta_inserita,
+    src.tipo_qta,
+    {sql_kg("src.qta_inserita", "src.tipo_qta", "p.kg_per_vaschetta")},
+    {sql_vaschette("src.qta_inserita", "src.tipo_qta", "p.kg_per_vaschetta")},
+    {sql_vaschette("src.qta_inserita", "src.tipo_qta", "p.kg_per_vaschetta")}
+"""
+
+
+def ripeti_ordine(cur, ordine_id, data_str, giorno):
+    """
+    Copia l'ordine `ordine_id` (testata e righe) sulla data indicata.
+    Ritorna l'id del nuovo ordine, oppure None se l'ordine non esiste.
+    """
+    cur.execute(
+        "INSERT INTO ordini (data, giorno, cliente_id) SELECT ?, ?, cliente_id FROM ordini WHERE id = ?",
+        (data_str, giorno, ordine_id),
+    )
+    if cur.rowcount == 0:
+        return None
+    nuovo_id = cur.lastrowid
+
+    cur.execute(
+        f"""
+        INSERT INTO righe_ordine (ordine_id, prodotto_id, qta_inserita, tipo_qta, kg, vaschette, da_allocare_v)
+        SELECT ?, {_COLONNE_RIGA_COPIATA}
+        FROM righe_ordine src
+        JOIN prodotti p ON p.id = src.prodotto_id
+        WHERE src.ordine_id = ?
+        """,
+        (nuovo_id, ordine_id),
+    )
+    alloca_ordine(cur, nuovo_id)
+    return nuovo_id
+
+
+def genera_da_modelli(cur, data_str, giorno, modello_id=None):
+    """
+    Crea gli ordini del giorno dai modelli: quello indicato, oppure tutti
+    i modelli ricorrenti. Un modello già usato per quel giorno viene saltato.
+    Ritorna il numero di ordini creati.
+    """
+    if modello_id is None:
+        filtro, params = "m.ricorrente = 1", ()
+    else:
+        filtro, params = "m.id = ?", (modello_id,)
+
+    cur.execute(
+        f"""
+        INSERT INTO ordini (data, giorno, cliente_id, modello_id)
+        SELECT ?, ?, m.cliente_id, m.id
+        FROM modelli_ordine m
+        WHERE {filtro}
+          AND EXISTS (SELECT 1 FROM righe_modello rm WHERE rm.modello_id = m.id)
+          AND NOT EXISTS (SELECT 1 FROM ordini o WHERE o.modello_id = m.id AND o.giorno = ?)
+        """,
+        (data_str, giorno, *params, giorno),
+    )
+    creati = cur.rowcount
+    if creati == 0:
+        return 0
+
+    # le testate appena inserite hanno id consecutivi che finiscono in lastrowid
+    cur.execute(
+        f"""
+        INSERT INTO righe_ordine (ordine_id, prodotto_id, qta_inserita, tipo_qta, kg, vaschette, da_allocare_v)
+        SELECT o.id, {_COLONNE_RIGA_COPIATA}
+        FROM ordini o
+        JOIN righe_modello src ON src.modello_id = o.modello_id
+        JOIN prodotti p ON p.id = src.prodotto_id
+        WHERE o.id BETWEEN ? AND ?
+        """,
+        (cur.lastrowid - creati + 1, cur.lastrowid),
+    )
+    alloca_giorno(cur, giorno)
+    return creati
+
+
+@app.route("/ordini/<int:ordine_id>/ripeti", methods=["POST"])
+def ripeti(ordine_id):
+    data = data_da_form(request.form.get("data"))
+    if data is None:
+        flash("Data non valida (formato AAAA-MM-GG).", "danger")
+        return redirect(url_for("lista_ordini"))
+
+    conn = get_db_connection()
+    nuovo_id = ripeti_ordine(conn.cursor(), ordine_id, *data)
+    conn.commit()
+    conn.close()
+
+    if nuovo_id is None:
+        flash("Ordine non trovato.", "danger")
+    else:
+        flash(f"Ordine ripetuto per il {data[0]}.", "success")
+    return redirect(url_for("lista_ordini"))
+
+
+@app.route("/clienti/<int:id>/ripeti_ultimo", methods=["POST"])
+def ripeti_ultimo_ordine(id):
+    data = data_da_form(request.form.get("data"))
+    if data is None:
+        flash("Data non valida (formato AAAA-MM-GG).", "danger")
+        return redirect(url_for("clienti"))
+
     conn = get_db_connection()
     cur = conn.cursor()
-    # prima elimino righe
-    cur.execute("DELETE FROM righe_ordine WHERE ordine_id = ?", (ordine_id,))
-    # poi testata
-    cur.execute("DELETE FROM ordini WHERE id = ?", (ordine_id,))
+    cur.execute(
+        "SELECT id FROM ordini WHERE cliente_id = ? ORDER BY giorno DESC, id DESC LIMIT 1",
+        (id,),
+    )
+    ultimo = cur.fetchone()
+
+    if ultimo is None:
+        conn.close()
+        flash("Il cliente non ha ordini da ripetere.", "warning")
+        return redirect(url_for("clienti"))
+
+    ripeti_ordine(cur, ultimo["id"], *data)
     conn.commit()
     conn.close()
-    flash("Ordine eliminato.", "info")
+    flash(f"Ultimo ordine ripetuto per il {data[0]}.", "success")
+    return redirect(url_for("lista_ordini"))
+
+
+@app.route("/modelli")
+def modelli():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT m.id,
+               m.nome,
+               m.ricorrente,
+               c.nome AS cliente_nome,
+               c.codice AS cliente_codice,
+               (SELECT COUNT(*) FROM righe_modello rm WHERE rm.modello_id = m.id) AS num_righe
+        FROM modelli_ordine m
+        JOIN clienti c ON c.id = m.cliente_id
+        ORDER BY c.nome, m.nome
+        """
+    )
+    modelli_rows = cur.fetchall()
+    conn.close()
+    return render_template("modelli.html", modelli=modelli_rows, oggi=date.today().isoformat())
+
+
+@app.route("/ordini/<int:ordine_id>/salva_modello", methods=["POST"])
+def salva_modello(ordine_id):
+    nome = request.form.get("nome", "").strip()
+    ricorrente = 1 if request.form.get("ricorrente") else 0
+
+    if not nome:
+        flash("Il nome del modello è obbligatorio.", "danger")
+        return redirect(url_for("dettaglio_ordine", ordine_id=ordine_id))
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO modelli_ordine (cliente_id, nome, ricorrente) SELECT cliente_id, ?, ? FROM ordini WHERE id = ?",
+        (nome, ricorrente, ordine_id),
+    )
+    if cur.rowcount == 0:
+        conn.close()
+        flash("Ordine non trovato.", "danger")
+        return redirect(url_for("lista_ordini"))
+
+    cur.execute(
+        """
+        INSERT INTO righe_modello (modello_id, prodotto_id, qta_inserita, tipo_qta)
+        SELECT ?, prodotto_id, qta_inserita, tipo_qta
+        FROM righe_ordine
+        WHERE ordine_id = ?
+        """,
+        (cur.lastrowid, ordine_id),
+    )
+    conn.commit()
+    conn.close()
+    flash("Modello salvato.", "success")
+    return redirect(url_for("modelli"))
+
+
+@app.route("/modelli/<int:modello_id>/ricorrente", methods=["POST"])
+def modello_ricorrente(modello_id):
+    conn = get_db_connection()
+    conn.execute(
+        "UPDATE modelli_ordine SET ricorrente = 1 - ricorrente WHERE id = ?",
+        (modello_id,),
+    )
+    conn.commit()
+    conn.close()
+    return redirect(url_for("modelli"))
+
+
+@app.route("/modelli/<int:modello_id>/elimina", methods=["POST"])
+def elimina_modello(modello_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    # righe in cascata; gli ordini già generati restano (modello_id = NULL)
+    cur.execute("DELETE FROM modelli_ordine WHERE id = ?", (modello_id,))
+    conn.commit()
+    conn.close()
+    flash("Modello eliminato.", "info")
+    return redirect(url_for("modelli"))
+
+
+@app.route("/modelli/genera", methods=["POST"])
+def genera_ordini_modelli():
+    """Un modello (campo modello_id) oppure tutti i ricorrenti, per la data scelta."""
+    data = data_da_form(request.form.get("data"))
+    if data is None:
+        flash("Data non valida (formato AAAA-MM-GG).", "danger")
+        return redirect(url_for("modelli"))
+
+    modello_id = request.form.get("modello_id", type=int)
+
+    conn = get_db_connection()
+    creati = genera_da_modelli(conn.cursor(), *data, modello_id=modello_id)
+    conn.commit()
+    conn.close()
+
+    if creati:
+        flash(f"{creati} ordini creati per il {data[0]}.", "success")
+    else:
+        flash(f"Nessun nuovo ordine: modelli già usati per il {data[0]} o senza righe.", "warning")
     return redirect(url_for("lista_ordini"))
 
 
@@ -485,36 +1180,88 @@ def produzione():
     cur = conn.cursor()
 
     if request.method == "POST":
-        data = request.form.get("data") or datetime.today().strftime("%Y-%m-%d")
+        data = data_da_form(request.form.get("data"))
         prodotto_id = request.form.get("prodotto_id")
         vaschette = request.form.get("vaschette_prodotte", "").replace(",", ".")
+        lotto = request.form.get("lotto", "").strip() or None
+        scadenza_str = request.form.get("scadenza", "").strip()
+
+        if data is None:
+            conn.close()
+            flash("Data non valida (formato AAAA-MM-GG).", "danger")
+            return redirect(url_for("produzione"))
+
+        cur.execute("SELECT giorni_scadenza FROM prodotti WHERE id = ?", (prodotto_id,))
+        prodotto = cur.fetchone()
+        if prodotto is None:
+            conn.close()
+            flash("Seleziona un prodotto.", "danger")
+            return redirect(url_for("produzione"))
+
+        if scadenza_str:
+            scadenza = data_da_form(scadenza_str)
+            if scadenza is None:
+                conn.close()
+                flash("Data di scadenza non valida (formato AAAA-MM-GG).", "danger")
+                return redirect(url_for("produzione"))
+            if scadenza[1] < data[1]:
+                conn.close()
+                flash("La scadenza non può essere precedente alla data di produzione.", "danger")
+                return redirect(url_for("produzione"))
+        else:
+            scadenza_giorno = scadenza_default(data[1], prodotto["giorni_scadenza"])
+            scadenza = (data_da_giorno(scadenza_giorno).isoformat(), scadenza_giorno)
 
         try:
             v = float(vaschette)
         except ValueError:
+            conn.close()
             flash("Numero di vaschette non valido.", "danger")
             return redirect(url_for("produzione"))
 
         if v <= 0:
+            conn.close()
             flash("Le vaschette devono essere maggiori di 0.", "danger")
             return redirect(url_for("produzione"))
 
         cur.execute(
             """
-            INSERT INTO produzione (data, prodotto_id, vaschette_prodotte)
-            VALUES (?, ?, ?)
+            INSERT INTO produzione (data, giorno, prodotto_id, vaschette_prodotte,
+                                    lotto, scadenza, scadenza_giorno, residuo_v)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            (data, prodotto_id, v),
+            (data[0], data[1], prodotto_id, v, lotto, scadenza[0], scadenza[1], v),
         )
+        if lotto is None:
+            cur.execute(
+                "UPDATE produzione SET lotto = ? WHERE id = ?",
+                (f"L{data[1]}-{cur.lastrowid}", cur.lastrowid),
+            )
+        # il nuovo lotto copre le righe d'ordine rimaste scoperte
+        alloca_prodotto(cur, prodotto_id, data[1], scadenza[1])
         conn.commit()
         conn.close()
         flash("Produzione registrata.", "success")
         return redirect(url_for("produzione"))
 
     # GET
+    dal, al, giorno_inizio, giorno_fine = periodo_elenco()
     cur.execute("SELECT * FROM prodotti ORDER BY nome")
     prodotti = cur.fetchall()
 
+    tabella = tabella_in_cache(
+        cur,
+        "produzione",
+        ("produzione", "prodotti", "righe_ordine", "allocazioni"),
+        lambda: _tabella_produzione(cur, giorno_inizio, giorno_fine),
+        giorno_inizio,
+        giorno_fine,
+    )
+    conn.close()
+    return render_template("produzione.html", prodotti=prodotti, tabella=tabella, dal=dal, al=al)
+
+
+def _tabella_produzione(cur, giorno_inizio, giorno_fine):
     cur.execute(
         """
         SELECT pr.*,
@@ -523,8 +1270,10 @@ def produzione():
                p.kg_per_vaschetta
         FROM produzione pr
         JOIN prodotti p ON p.id = pr.prodotto_id
-        ORDER BY pr.data DESC, pr.id DESC
-        """
+        WHERE pr.giorno BETWEEN ? AND ?
+        ORDER BY pr.giorno DESC, pr.id DESC
+        """,
+        (giorno_inizio, giorno_fine),
     )
     rows = cur.fetchall()
 
@@ -535,23 +1284,256 @@ def produzione():
             {
                 "id": r["id"],
                 "data": r["data"],
-                "nome": r["prodotto_nome"],
-                "codice": r["prodotto_codice"],
-                "vaschette": r["vaschette_prodotte"],
-                "kg": kg,
+                "prodotto_nome": r["prodotto_nome"],
+                "prodotto_codice": r["prodotto_codice"],
+                "vaschette_prodotte": r["vaschette_prodotte"],
+                "kg_prodotti": kg,
+                "lotto": r["lotto"],
+                "scadenza": r["scadenza"],
+                "residuo_v": r["residuo_v"] or 0,
             }
         )
 
+    return render_template("frammenti/produzione.html", produzione=produzione_calc)
+
+
+@app.route("/produzione/<int:prod_id>/elimina", methods=["POST"])
+def elimina_produzione(prod_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    # controllo lotto già assegnato a ordini
+    cur.execute("SELECT EXISTS (SELECT 1 FROM allocazioni WHERE produzione_id = ?)", (prod_id,))
+    if cur.fetchone()[0]:
+        flash("Impossibile eliminare: il lotto è già assegnato a degli ordini.", "danger")
+    else:
+        cur.execute("DELETE FROM produzione WHERE id = ?", (prod_id,))
+        conn.commit()
+        flash("Produzione eliminata.", "info")
+
     conn.close()
-    return render_template("produzione.html", prodotti=prodotti, produzione=produzione_calc)
+    return redirect(url_for("produzione"))
 
 
 # ---------------------- MAGAZZINO ----------------------
 
 
+def lotti_in_scadenza():
+    """Lotti con vaschette libere che scadono entro GIORNI_AVVISO_SCADENZA (o già scaduti)."""
+    limite = aggiungi_giorni(giorno_da_data(date.today()), GIORNI_AVVISO_SCADENZA)
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT pr.id,
+               pr.lotto,
+               pr.data,
+               pr.scadenza,
+               pr.scadenza_giorno,
+               pr.residuo_v,
+               p.nome AS prodotto_nome,
+               p.codice AS prodotto_codice
+        FROM produzione pr
+        JOIN prodotti p ON p.id = pr.prodotto_id
+        WHERE pr.residuo_v > 0 AND pr.scadenza_giorno <= ?
+        ORDER BY pr.scadenza_giorno, p.nome
+        """,
+        (limite,),
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
 @app.route("/magazzino")
 def magazzino():
-    return render_template("magazzino.html", magazzino=calcola_magazzino())
+    oggi = giorno_da_data(date.today())
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    tabella = tabella_in_cache(
+        cur,
+        "magazzino",
+        ("prodotti", "produzione", "righe_ordine"),
+        lambda: render_template("frammenti/magazzino.html", magazzino=calcola_magazzino()),
+    )
+    # i lotti in scadenza dipendono anche dal giorno
+    tabella_lotti = tabella_in_cache(
+        cur,
+        "lotti_scadenza",
+        ("prodotti", "produzione", "righe_ordine", "allocazioni"),
+        lambda: render_template("frammenti/lotti_scadenza.html", lotti_scadenza=lotti_in_scadenza(), oggi=oggi),
+        oggi,
+    )
+    conn.close()
+    return render_template("magazzino.html", tabella=tabella, tabella_lotti=tabella_lotti)
+
+
+@app.route("/lotti/alloca", methods=["POST"])
+def alloca_lotti():
+    """Riprova ad assegnare i lotti alle righe scoperte degli ordini di un giorno."""
+    data = data_da_form(request.form.get("data"))
+    if data is None:
+        flash("Data non valida (formato AAAA-MM-GG).", "danger")
+        return redirect(url_for("magazzino"))
+
+    conn = get_db_connection()
+    assegnate = alloca_giorno(conn.cursor(), data[1])
+    conn.commit()
+    conn.close()
+    flash(f"Assegnate {assegnate:.2f} vaschette dai lotti per il {data[0]}.", "success")
+    return redirect(url_for("magazzino"))
+
+
+# ---------------------- PIANIFICAZIONE PRODUZIONE ----------------------
+
+
+@app.route("/pianificazione")
+def pianificazione():
+    giorni = max(1, min(request.args.get("giorni", 30, type=int), 90))
+    anticipo = max(0, min(request.args.get("anticipo", 2, type=int), 14))
+
+    oggi = giorno_da_data(date.today())
+    ultimo = aggiungi_giorni(oggi, giorni - 1)
+    chiavi = [aggiungi_giorni(oggi, i) for i in range(giorni)]
+    indice = {g: i for i, g in enumerate(chiavi)}
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    # giacenza in kg a oggi: produzione fino a oggi, ordini consegnati prima di oggi
+    cur.execute(
+        """
+        SELECT p.id, p.codice, p.nome, p.kg_per_vaschetta, p.kg_ora,
+               (p.giacenza_iniziale_vaschette
+                + COALESCE((SELECT SUM(pr.vaschette_prodotte) FROM produzione pr
+                            WHERE pr.prodotto_id = p.id
+                              AND (pr.giorno IS NULL OR pr.giorno <= ?)), 0)
+               ) * p.kg_per_vaschetta
+               - COALESCE((SELECT SUM(ro.kg) FROM righe_ordine ro
+                           JOIN ordini o ON o.id = ro.ordine_id
+                           WHERE ro.prodotto_id = p.id
+                             AND (o.giorno IS NULL OR o.giorno < ?)), 0) AS giacenza_kg
+        FROM prodotti p
+        ORDER BY p.nome
+        """,
+        (oggi, oggi),
+    )
+    prodotti_rows = cur.fetchall()
+
+    cur.execute(
+        """
+        SELECT o.giorno, ro.prodotto_id, SUM(ro.kg) AS kg
+        FROM ordini o
+        JOIN righe_ordine ro ON ro.ordine_id = o.id
+        WHERE o.giorno BETWEEN ? AND ?
+        GROUP BY o.giorno, ro.prodotto_id
+        """,
+        (oggi, ultimo),
+    )
+    domanda = {}
+    for r in cur.fetchall():
+        domanda.setdefault(r["prodotto_id"], []).append((indice[r["giorno"]], r["kg"]))
+
+    cur.execute("SELECT * FROM linee_produzione ORDER BY nome")
+    linee = cur.fetchall()
+    conn.close()
+
+    t0 = time.perf_counter()
+    piano, mancanze = pianifica(
+        domanda,
+        {p["id"]: p["giacenza_kg"] for p in prodotti_rows},
+        {p["id"]: p["kg_ora"] for p in prodotti_rows},
+        [(l["id"], l["ore_giorno"]) for l in linee],
+        giorni,
+        anticipo_max=anticipo,
+    )
+    ms = (time.perf_counter() - t0) * 1000
+
+    prodotti_per_id = {p["id"]: p for p in prodotti_rows}
+    linee_per_id = {l["id"]: l["nome"] for l in linee}
+    for voce in piano + mancanze:
+        p = prodotti_per_id[voce["prodotto_id"]]
+        voce["data"] = data_da_giorno(chiavi[voce["giorno"]])
+        voce["prodotto_nome"] = p["nome"]
+        voce["prodotto_codice"] = p["codice"]
+        voce["vaschette"] = voce["kg"] / p["kg_per_vaschetta"] if p["kg_per_vaschetta"] else 0
+        if "linea_id" in voce:
+            voce["linea_nome"] = linee_per_id[voce["linea_id"]]
+
+    return render_template(
+        "pianificazione.html",
+        piano=piano,
+        mancanze=mancanze,
+        linee=linee,
+        prodotti=prodotti_rows,
+        giorni=giorni,
+        anticipo=anticipo,
+        ms=ms,
+    )
+
+
+@app.route("/pianificazione/linee", methods=["POST"])
+def aggiungi_linea():
+    nome = request.form.get("nome", "").strip()
+    ore = request.form.get("ore_giorno", "").replace(",", ".")
+
+    try:
+        ore = float(ore)
+    except ValueError:
+        ore = 0
+
+    if not nome or ore <= 0:
+        flash("Servono nome della linea e ore al giorno maggiori di 0.", "danger")
+        return redirect(url_for("pianificazione"))
+
+    conn = get_db_connection()
+    try:
+        conn.execute("INSERT INTO linee_produzione (nome, ore_giorno) VALUES (?, ?)", (nome, ore))
+        conn.commit()
+        flash("Linea aggiunta.", "success")
+    except sqlite3.IntegrityError:
+        flash("Linea già esistente.", "danger")
+    conn.close()
+    return redirect(url_for("pianificazione"))
+
+
+@app.route("/pianificazione/linee/<int:linea_id>/elimina", methods=["POST"])
+def elimina_linea(linea_id):
+    conn = get_db_connection()
+    conn.execute("DELETE FROM linee_produzione WHERE id = ?", (linea_id,))
+    conn.commit()
+    conn.close()
+    flash("Linea eliminata.", "info")
+    return redirect(url_for("pianificazione"))
+
+
+@app.route("/pianificazione/kg_ora", methods=["POST"])
+def salva_kg_ora():
+    """Salva in blocco i kg/ora dei prodotti (campi kg_ora_<id>, vuoto = non impostato)."""
+    valori = []
+    for chiave, valore in request.form.items():
+        if not chiave.startswith("kg_ora_"):
+            continue
+        valore = valore.strip().replace(",", ".")
+        try:
+            prodotto_id = int(chiave[len("kg_ora_"):])
+            kg_ora = float(valore) if valore else None
+        except ValueError:
+            flash("Valori kg/ora non validi.", "danger")
+            return redirect(url_for("pianificazione"))
+        if kg_ora is not None and kg_ora <= 0:
+            kg_ora = None
+        valori.append((kg_ora, prodotto_id, kg_ora))
+
+    # aggiorna solo i prodotti cambiati (il registro modifiche resta pulito)
+    conn = get_db_connection()
+    conn.executemany("UPDATE prodotti SET kg_ora = ? WHERE id = ? AND kg_ora IS NOT ?", valori)
+    conn.commit()
+    conn.close()
+    flash("Capacità dei prodotti salvate.", "success")
+    return redirect(url_for("pianificazione"))
 
 
 # ---------------------- EXPORT LISTE CSV ----------------------
@@ -559,9 +1541,11 @@ def magazzino():
 
 @app.route("/export/lista_carico")
 def export_lista_carico():
-    data_str = request.args.get("data")
-    if not data_str:
-        data_str = datetime.today().strftime("%Y-%m-%d")
+    data = data_da_form(request.args.get("data"))
+    if data is None:
+        flash("Data non valida (formato AAAA-MM-GG).", "danger")
+        return redirect(url_for("index"))
+    data_str, giorno = data
 
     conn = get_db_connection()
     cur = conn.cursor()
@@ -572,17 +1556,16 @@ def export_lista_carico():
                c.codice AS cliente_codice,
                p.nome AS prodotto_nome,
                p.codice AS prodotto_codice,
-               p.kg_per_vaschetta,
-               ro.qta_inserita,
-               ro.tipo_qta
+               ro.kg,
+               ro.vaschette
         FROM righe_ordine ro
         JOIN ordini o ON ro.ordine_id = o.id
         JOIN clienti c ON o.cliente_id = c.id
         JOIN prodotti p ON ro.prodotto_id = p.id
-        WHERE o.data = ?
+        WHERE o.giorno = ?
         ORDER BY c.nome, p.nome
         """,
-        (data_str,),
+        (giorno,),
     )
     rows = cur.fetchall()
     conn.close()
@@ -594,16 +1577,8 @@ def export_lista_carico():
     )
 
     for r in rows:
-        q = r["qta_inserita"]
-        t = r["tipo_qta"]
-        kg_v = r["kg_per_vaschetta"]
-
-        if t == "kg":
-            kg = q
-            vaschette = q / kg_v if kg_v else 0
-        else:
-            vaschette = q
-            kg = q * kg_v
+        kg = r["kg"]
+        vaschette = r["vaschette"]
 
         writer.writerow(
             [
@@ -697,11 +1672,14 @@ def stampa_checklist(id):
 
     cur.execute(
         """
-        SELECT ro.qta_inserita,
-               ro.tipo_qta,
+        SELECT ro.kg,
+               ro.vaschette,
                p.nome AS prodotto_nome,
                p.codice AS prodotto_codice,
-               p.kg_per_vaschetta
+               (SELECT group_concat(pr.lotto, ', ')
+                FROM allocazioni a
+                JOIN produzione pr ON pr.id = a.produzione_id
+                WHERE a.riga_ordine_id = ro.id) AS lotti
         FROM righe_ordine ro
         JOIN prodotti p ON p.id = ro.prodotto_id
         WHERE ro.ordine_id = ?
@@ -712,7 +1690,7 @@ def stampa_checklist(id):
     righe = cur.fetchall()
     conn.close()
 
-    doc = Document()
+    doc = nuovo_documento()
 
     doc.add_heading("MAMMA CHE PASTA Srl - Checklist di Carico", level=1)
 
@@ -724,27 +1702,20 @@ def stampa_checklist(id):
     doc.add_paragraph(cliente_line)
     doc.add_paragraph("")
 
-    table = doc.add_table(rows=1, cols=4)
+    table = doc.add_table(rows=1, cols=5)
     hdr = table.rows[0].cells
     hdr[0].text = "Prodotto"
     hdr[1].text = "Kg"
     hdr[2].text = "Vaschette"
-    hdr[3].text = "Check"
+    hdr[3].text = "Lotto"
+    hdr[4].text = "Check"
 
     tot_kg = 0
     tot_v = 0
 
     for r in righe:
-        q = r["qta_inserita"]
-        t = r["tipo_qta"]
-        kg_v = r["kg_per_vaschetta"] or 0
-
-        if t == "kg":
-            kg = q
-            vaschette = q / kg_v if kg_v else 0
-        else:
-            vaschette = q
-            kg = q * kg_v
+        kg = r["kg"]
+        vaschette = r["vaschette"]
 
         tot_kg += kg
         tot_v += vaschette
@@ -757,7 +1728,8 @@ def stampa_checklist(id):
         row[0].text = nome
         row[1].text = f"{kg:.2f}"
         row[2].text = f"{vaschette:.2f}"
-        row[3].text = "[ ]"
+        row[3].text = r["lotti"] or ""
+        row[4].text = "[ ]"
 
     doc.add_paragraph("")
     doc.add_paragraph(f"Totale kg: {tot_kg:.2f}")
@@ -784,9 +1756,11 @@ def stampa_checklist(id):
 
 @app.route("/ordini/stampa_giorno")
 def stampa_giorno():
-    data_str = request.args.get("data")
-    if not data_str:
-        data_str = datetime.today().strftime("%Y-%m-%d")
+    data = data_da_form(request.args.get("data"))
+    if data is None:
+        flash("Data non valida (formato AAAA-MM-GG).", "danger")
+        return redirect(url_for("lista_ordini"))
+    data_str, giorno = data
 
     conn = get_db_connection()
     cur = conn.cursor()
@@ -799,10 +1773,10 @@ def stampa_giorno():
                c.codice AS cliente_codice
         FROM ordini o
         JOIN clienti c ON o.cliente_id = c.id
-        WHERE o.data = ?
+        WHERE o.giorno = ?
         ORDER BY c.nome ASC, o.id ASC
         """,
-        (data_str,),
+        (giorno,),
     )
     ordini = cur.fetchall()
 
@@ -811,7 +1785,7 @@ def stampa_giorno():
         flash("Nessun ordine trovato per questa data.", "warning")
         return redirect(url_for("lista_ordini"))
 
-    doc = Document()
+    doc = nuovo_documento()
     doc.add_heading(f"Ordini del giorno - {data_str}", level=1)
 
     for ordine in ordini:
@@ -823,11 +1797,10 @@ def stampa_giorno():
 
         cur.execute(
             """
-            SELECT ro.qta_inserita,
-                   ro.tipo_qta,
+            SELECT ro.kg,
+                   ro.vaschette,
                    p.nome AS prodotto_nome,
-                   p.codice AS prodotto_codice,
-                   p.kg_per_vaschetta
+                   p.codice AS prodotto_codice
             FROM righe_ordine ro
             JOIN prodotti p ON ro.prodotto_id = p.id
             WHERE ro.ordine_id = ?
@@ -848,16 +1821,8 @@ def stampa_giorno():
         tot_v = 0
 
         for r in righe:
-            q = r["qta_inserita"]
-            t = r["tipo_qta"]
-            kg_v = r["kg_per_vaschetta"] or 0
-
-            if t == "kg":
-                kg = q
-                vaschette = q / kg_v if kg_v else 0
-            else:
-                vaschette = q
-                kg = q * kg_v
+            kg = r["kg"]
+            vaschette = r["vaschette"]
 
             tot_kg += kg
             tot_v += vaschette
@@ -888,54 +1853,175 @@ def stampa_giorno():
         download_name=f"ordini_{data_str}.docx",
         mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
     )
+
+
+@app.route("/ordini/etichette")
+def etichette_giorno():
+    """Etichette PDF (cliente, prodotto, vaschette, kg, codice a barre) per il carico del giorno."""
+    data = data_da_form(request.args.get("data"))
+    if data is None:
+        flash("Data non valida (formato AAAA-MM-GG).", "danger")
+        return redirect(url_for("index"))
+    data_str, giorno = data
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    # un'etichetta per ordine e prodotto: più righe dello stesso prodotto si sommano
+    cur.execute(
+        """
+        SELECT o.id AS ordine_id,
+               c.nome AS cliente_nome,
+               c.codice AS cliente_codice,
+               p.id AS prodotto_id,
+               p.nome AS prodotto_nome,
+               p.codice AS prodotto_codice,
+               SUM(ro.vaschette) AS vaschette,
+               SUM(ro.kg) AS kg
+        FROM ordini o
+        JOIN clienti c ON c.id = o.cliente_id
+        JOIN righe_ordine ro ON ro.ordine_id = o.id
+        JOIN prodotti p ON p.id = ro.prodotto_id
+        WHERE o.giorno = ?
+        GROUP BY o.id, p.id
+        ORDER BY c.nome, o.id, p.nome
+        """,
+        (giorno,),
+    )
+    data_it = data_da_giorno(giorno).strftime("%d/%m/%Y")
+    righe = [dict(r, data=data_it) for r in cur.fetchall()]
+    conn.close()
+
+    if not righe:
+        flash("Nessun ordine trovato per questa data.", "warning")
+        return redirect(url_for("index"))
+
+    import etichette
+
+    return send_file(
+        etichette.crea_pdf(righe, titolo=f"Etichette carico {data_it}"),
+        as_attachment=True,
+        download_name=f"etichette_{data_str}.pdf",
+        mimetype="application/pdf",
+    )
+
+
 @app.route("/statistiche")
 def statistiche():
+    dal = request.args.get("dal", "")
+    al = request.args.get("al", "")
+    try:
+        giorno_inizio, giorno_fine = intervallo(dal, al)
+    except ValueError:
+        flash("Intervallo di date non valido (formato AAAA-MM-GG).", "danger")
+        dal = al = ""
+        giorno_inizio, giorno_fine = GIORNO_MIN, GIORNO_MAX
+
     conn = get_db_connection()
     cur = conn.cursor()
+    dati = tabella_in_cache(
+        cur,
+        "statistiche",
+        ("ordini", "righe_ordine", "prodotti", "clienti"),
+        lambda: _dati_statistiche(cur, giorno_inizio, giorno_fine),
+        giorno_inizio,
+        giorno_fine,
+    )
+    conn.close()
 
+    return render_template("statistiche.html", dati=dati, dal=dal, al=al)
+
+
+def _dati_statistiche(cur, giorno_inizio, giorno_fine):
+    """Dati dei grafici (script JS) per l'intervallo di giorni."""
     # Prodotti più venduti
     cur.execute("""
-        SELECT p.nome AS prodotto, SUM(r.qta_inserita) AS totale
-        FROM righe_ordine r
-        JOIN prodotti p ON p.id = r.prodotto_id
-        GROUP BY p.id
-        ORDER BY totale DESC
+        SELECT p.nome AS prodotto, t.totale
+        FROM (
+            SELECT r.prodotto_id, SUM(r.kg) AS totale
+            FROM ordini o
+            JOIN righe_ordine r ON r.ordine_id = o.id
+            WHERE o.giorno BETWEEN ? AND ?
+            GROUP BY r.prodotto_id
+        ) t
+        JOIN prodotti p ON p.id = t.prodotto_id
+        ORDER BY t.totale DESC
         LIMIT 10
-    """)
+    """, (giorno_inizio, giorno_fine))
     top_prodotti = cur.fetchall()
 
     # Clienti con il maggior numero di acquisti
     cur.execute("""
-        SELECT c.nome AS cliente, SUM(r.qta_inserita) AS totale
-        FROM righe_ordine r
-        JOIN ordini o ON o.id = r.ordine_id
+        SELECT c.nome AS cliente, SUM(r.kg) AS totale
+        FROM ordini o
+        JOIN righe_ordine r ON r.ordine_id = o.id
         JOIN clienti c ON c.id = o.cliente_id
+        WHERE o.giorno BETWEEN ? AND ?
         GROUP BY c.id
         ORDER BY totale DESC
         LIMIT 10
-    """)
+    """, (giorno_inizio, giorno_fine))
     top_clienti = cur.fetchall()
 
     # Andamento mensile
     cur.execute("""
-        SELECT strftime('%Y-%m', o.data) AS mese,
-               SUM(r.qta_inserita) AS totale
-        FROM righe_ordine r
-        JOIN ordini o ON o.id = r.ordine_id
-        GROUP BY mese
-        ORDER BY mese ASC
-    """)
+        SELECT printf('%04d-%02d', o.giorno / 10000, o.giorno / 100 % 100) AS mese,
+               SUM(r.kg) AS totale
+        FROM ordini o
+        JOIN righe_ordine r ON r.ordine_id = o.id
+        WHERE o.giorno BETWEEN ? AND ?
+        GROUP BY o.giorno / 100
+        ORDER BY o.giorno / 100 ASC
+    """, (giorno_inizio, giorno_fine))
     andamento = cur.fetchall()
 
-    conn.close()
-
     return render_template(
-        "statistiche.html",
+        "frammenti/statistiche.html",
         top_prodotti=top_prodotti,
         top_clienti=top_clienti,
-        andamento=andamento
+        andamento=andamento,
     )
 
+# ---------------------- SINCRONIZZAZIONE CONTABILITÀ ----------------------
+
+
+@app.route("/sync/modifiche")
+def sync_modifiche():
+    """
+    Modifiche successive al cursore `dopo`, in JSON Lines.
+    L'header X-Cursore contiene il seq da passare alla chiamata successiva.
+    """
+    try:
+        dopo = int(request.args.get("dopo", 0))
+        limite = int(request.args.get("limite", 1000))
+    except ValueError:
+        return Response("Parametri dopo/limite non validi.\n", status=400, mimetype="text/plain")
+
+    conn = get_db_connection()
+    righe, ultimo = modifiche.leggi_modifiche(conn, dopo, limite)
+    conn.close()
+
+    return Response(
+        "".join(r + "\n" for r in righe),
+        mimetype="application/x-ndjson",
+        headers={"X-Cursore": str(ultimo)},
+    )
+
+
+@app.cli.command("esporta-modifiche")
+@click.option("--dopo", default=0, show_default=True, help="Ultimo seq già sincronizzato.")
+@click.option("--limite", default=1000, show_default=True, help="Modifiche lette per blocco.")
+def esporta_modifiche(dopo, limite):
+    """Stampa in JSON Lines tutte le modifiche successive al cursore."""
+    conn = get_db_connection()
+    while True:
+        righe, ultimo = modifiche.leggi_modifiche(conn, dopo, limite)
+        for r in righe:
+            click.echo(r)
+        if ultimo == dopo:
+            break
+        dopo = ultimo
+    conn.close()
+    click.echo(f"cursore: {dopo}", err=True)
 
 
 # ---------------------- MAIN ----------------------
@@ -0,0 +1,117 @@
+"""
+Benchmark di avvio del gestionale: tempo di import di app.py e memoria
+(RSS, su Windows il working set) di un processo appena avviato, come un
+worker a freddo. È la memoria occupata dopo l'import, non il picco.
+
+Ogni misura gira in un processo Python nuovo, sia in modalità normale sia
+con GESTIONALE_PRECARICA_STAMPE=1 (worker dedicato alle stampe).
+
+Uso:
+    py bench_avvio.py [--ripetizioni 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CARTELLA = os.path.dirname(os.path.abspath(__file__))
+
+CODICE_MISURA = r"""
+import json, os, sys, time
+
+# memoria attuale del processo (RSS, su Windows il working set), non il picco
+def rss_kb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss // 1024
+    except ImportError:
+        pass
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        kernel32 = ctypes.WinDLL("kernel32")
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        kernel32.K32GetProcessMemoryInfo.argtypes = [
+            wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD,
+        ]
+        contatori = PROCESS_MEMORY_COUNTERS()
+        contatori.cb = ctypes.sizeof(contatori)
+        if kernel32.K32GetProcessMemoryInfo(
+            kernel32.GetCurrentProcess(), ctypes.byref(contatori), contatori.cb
+        ):
+            return contatori.WorkingSetSize // 1024
+        return None
+    try:
+        # Linux: seconda colonna = pagine residenti
+        with open("/proc/self/statm") as f:
+            pagine = int(f.read().split()[1])
+        return pagine * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+rss_avvio = rss_kb()
+app.nuovo_documento()
+t2 = time.perf_counter()
+
+print(json.dumps({
+    "import_s": t1 - t0,
+    "prima_stampa_s": t2 - t1,
+    "rss_kb": rss_avvio,
+}))
+"""
+
+
+def misura(precarica):
+    env = dict(os.environ)
+    env["GESTIONALE_PRECARICA_STAMPE"] = "1" if precarica else "0"
+    out = subprocess.run(
+        [sys.executable, "-c", CODICE_MISURA],
+        cwd=CARTELLA,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def riassunto(nome, misure):
+    imp = statistics.median(m["import_s"] for m in misure) * 1000
+    stampa = statistics.median(m["prima_stampa_s"] for m in misure) * 1000
+    rss = [m["rss_kb"] for m in misure if m["rss_kb"] is not None]
+    rss_txt = f"{statistics.median(rss) / 1024:.1f} MB" if rss else "n/d"
+    print(f"{nome:<22} import {imp:8.1f} ms   prima stampa {stampa:8.1f} ms   RSS dopo avvio {rss_txt}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ripetizioni", type=int, default=5)
+    args = parser.parse_args()
+
+    for nome, precarica in (("normale", False), ("precarica stampe", True)):
+        riassunto(nome, [misura(precarica) for _ in range(args.ripetizioni)])
+
+
+if __name__ == "__main__":
+    main()
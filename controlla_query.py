@@ -0,0 +1,194 @@
+"""
+Controllo dei piani di esecuzione delle query del gestionale.
+
+Genera un database di prova in una cartella temporanea, chiama le route
+principali (elenco ordini, dettaglio, lista di carico, stampe, analisi,
+magazzino, produzione e i controlli prima delle cancellazioni) e registra
+ogni istruzione SQL eseguita. Su ciascuna lancia EXPLAIN QUERY PLAN: se
+una tabella grande viene letta per intero ("SCAN tabella", anche se
+percorsa attraverso un indice) il controllo fallisce ed esce con codice 1.
+Gli elenchi devono quindi leggere un intervallo (SEARCH), per esempio
+gli ultimi giorni come /ordini e /produzione.
+
+Da lanciare dopo ogni modifica alle query o agli indici:
+    py controlla_query.py [--giorni 60] [-v]
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from datetime import date
+
+# tabelle che crescono con gli ordini di ogni giorno; clienti, prodotti,
+# modelli e linee restano piccole e possono essere lette per intero
+TABELLE_GRANDI = ("ordini", "righe_ordine", "produzione", "allocazioni", "modifiche")
+
+PAROLE_NON_ALIAS = {
+    "where", "join", "left", "inner", "cross", "on", "group", "order",
+    "limit", "set", "using", "natural", "union", "as",
+}
+
+
+# ---------------------- RACCOLTA QUERY ----------------------
+
+
+def registra_query(gestionale, istruzioni):
+    """Fa passare da `istruzioni` ogni SQL eseguito sulle connessioni del gestionale."""
+    originale = gestionale.get_db_connection
+
+    def get_db_connection():
+        conn = originale()
+        conn.set_trace_callback(istruzioni.append)
+        return conn
+
+    gestionale.get_db_connection = get_db_connection
+
+
+def esegui_route(client, conn):
+    """Chiama le route da controllare; ritorna gli errori HTTP trovati."""
+    oggi = date.today().isoformat()
+    ordine_id = conn.execute(
+        "SELECT MAX(id) FROM ordini WHERE giorno <= ?", (int(oggi.replace("-", "")),)
+    ).fetchone()[0]
+    cliente_id = conn.execute("SELECT cliente_id FROM ordini WHERE id = ?", (ordine_id,)).fetchone()[0]
+    prodotto_id = conn.execute("SELECT prodotto_id FROM righe_ordine WHERE ordine_id = ?", (ordine_id,)).fetchone()[0]
+    lotto_id = conn.execute("SELECT MAX(produzione_id) FROM allocazioni").fetchone()[0]
+
+    letture = [
+        "/",
+        "/ordini",
+        f"/ordini/{ordine_id}/dettaglio",
+        f"/ordini/{ordine_id}/stampa_checklist",
+        f"/export/lista_carico?data={oggi}",
+        f"/ordini/stampa_giorno?data={oggi}",
+        "/statistiche",
+        f"/statistiche?dal={oggi[:8]}01&al={oggi}",
+        "/magazzino",
+        "/export/magazzino",
+        "/produzione",
+        "/pianificazione",
+        "/modelli",
+        "/sync/modifiche?dopo=0",
+    ]
+    scritture = [
+        # controlli prima delle cancellazioni: hanno dati collegati, restano
+        (f"/clienti/{cliente_id}/elimina", {}),
+        (f"/prodotti/{prodotto_id}/elimina", {}),
+        (f"/produzione/{lotto_id}/elimina", {}),
+        (f"/ordini/{ordine_id}/ripeti", {"data": oggi}),
+        (f"/clienti/{cliente_id}/ripeti_ultimo", {"data": oggi}),
+        ("/produzione", {"data": oggi, "prodotto_id": prodotto_id, "vaschette_prodotte": "20"}),
+        ("/lotti/alloca", {"data": oggi}),
+        (f"/ordini/{ordine_id}/elimina", {}),
+        ("/ordini/elimina_blocco", {"dal": oggi, "al": oggi, "cliente_id": cliente_id}),
+        ("/ordini/elimina_blocco", {"dal": oggi[:8] + "01", "al": oggi[:8] + "07"}),
+    ]
+
+    errori = []
+    for url in letture:
+        risposta = client.get(url)
+        if risposta.status_code != 200:
+            errori.append(f"GET {url}: HTTP {risposta.status_code}")
+    for url, dati in scritture:
+        risposta = client.post(url, data=dati)
+        if risposta.status_code >= 400:
+            errori.append(f"POST {url}: HTTP {risposta.status_code}")
+    return errori
+
+
+# ---------------------- ANALISI PIANI ----------------------
+
+
+def alias_tabelle(sql):
+    """{nome o alias: tabella} per le tabelle citate dopo FROM/JOIN/UPDATE."""
+    alias = {}
+    for tabella, nome in re.findall(
+        r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", sql, re.IGNORECASE
+    ):
+        alias[tabella] = tabella
+        if nome and nome.lower() not in PAROLE_NON_ALIAS:
+            alias[nome] = tabella
+    return alias
+
+
+def scansioni_complete(conn, sql):
+    """
+    Righe del piano che leggono per intero una tabella grande. Anche
+    "SCAN t USING [COVERING] INDEX" conta: l'indice dà solo l'ordine, le
+    righe lette sono comunque tutte.
+    """
+    alias = alias_tabelle(sql)
+    trovate = []
+    for riga in conn.execute("EXPLAIN QUERY PLAN " + sql):
+        dettaglio = riga[3]
+        m = re.match(r"SCAN (\w+)", dettaglio)
+        if not m:
+            continue
+        if alias.get(m.group(1), m.group(1)) in TABELLE_GRANDI:
+            trovate.append(dettaglio)
+    return trovate
+
+
+def da_controllare(sql):
+    sql = sql.lstrip()
+    if sql.startswith("--"):  # istruzioni interne dei trigger
+        return False
+    primo = sql.split(None, 1)[0].upper() if sql else ""
+    if primo in ("SELECT", "WITH", "UPDATE", "DELETE"):
+        return True
+    return primo == "INSERT" and re.search(r"\bSELECT\b", sql, re.IGNORECASE) is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Controllo dei piani di esecuzione delle query.")
+    parser.add_argument("--giorni", type=int, default=60, help="Giorni di storico nel DB di prova")
+    parser.add_argument("-v", "--verboso", action="store_true", help="Stampa il piano di ogni query")
+    args = parser.parse_args()
+
+    from dati_prova import genera_database
+
+    import app as gestionale
+
+    with tempfile.TemporaryDirectory() as cartella:
+        percorso = os.path.join(cartella, "piani.db")
+        print(f"Genero il database di prova ({args.giorni} giorni)...")
+        genera_database(percorso, giorni=args.giorni)
+        gestionale.DB_PATH = percorso
+
+        istruzioni = []
+        registra_query(gestionale, istruzioni)
+        conn = sqlite3.connect(percorso)
+        errori = esegui_route(gestionale.app.test_client(), conn)
+
+        # stesso testo con parametri diversi: il piano non cambia
+        uniche = {}
+        for sql in istruzioni:
+            if da_controllare(sql):
+                uniche.setdefault(re.sub(r"\b\d+(\.\d+)?\b|'[^']*'", "?", " ".join(sql.split())), sql)
+
+        problemi = []
+        for sql in uniche.values():
+            trovate = scansioni_complete(conn, sql)
+            if args.verboso or trovate:
+                print("\n" + " ".join(sql.split())[:300])
+                for riga in conn.execute("EXPLAIN QUERY PLAN " + sql):
+                    print("    " + riga[3])
+            if trovate:
+                problemi.append((sql, trovate))
+        conn.close()
+
+    print(f"\n{len(uniche)} query controllate.")
+    for errore in errori:
+        print("ERRORE " + errore)
+    for sql, trovate in problemi:
+        print(f"SCANSIONE COMPLETA ({', '.join(trovate)}): {' '.join(sql.split())[:120]}")
+    if errori or problemi:
+        sys.exit(1)
+    print("Nessuna scansione completa di tabelle grandi.")
+
+
+if __name__ == "__main__":
+    main()
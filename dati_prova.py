@@ -0,0 +1,136 @@
+"""
+Generatore di un database di prova realistico (clienti, prodotti, ordini
+giornalieri e produzione), usato dagli strumenti di carico e di controllo
+delle query. Non tocca mai gestionale.db.
+
+Uso:
+    py dati_prova.py prova.db [--giorni 90] [--ordini-giorno 40]
+"""
+
+import argparse
+import os
+import random
+from datetime import date, timedelta
+
+from giorni import giorno_da_data
+from unita import converti_qta
+
+
+def genera_database(
+    percorso,
+    clienti=150,
+    prodotti=60,
+    giorni=90,
+    ordini_giorno=40,
+    righe_ordine=6,
+    seed=1,
+):
+    """
+    Crea (sovrascrivendolo) un database con lo schema di app.init_db e dati
+    casuali ma riproducibili. Gli ordini coprono gli ultimi `giorni` giorni
+    fino a oggi compreso.
+    """
+    import app as gestionale
+
+    if os.path.exists(percorso):
+        os.remove(percorso)
+
+    rnd = random.Random(seed)
+    db_path_originale = gestionale.DB_PATH
+    gestionale.DB_PATH = percorso
+    try:
+        gestionale.init_db()
+        conn = gestionale.get_db_connection()
+    finally:
+        gestionale.DB_PATH = db_path_originale
+
+    cur = conn.cursor()
+
+    cur.executemany(
+        "INSERT INTO clienti (codice, nome) VALUES (?, ?)",
+        [(str(10000 + i), f"Cliente {i:04d}") for i in range(1, clienti + 1)],
+    )
+
+    kg_v = [rnd.choice((0.5, 1.0, 1.5, 2.0, 3.0)) for _ in range(prodotti)]
+    cur.executemany(
+        """
+        INSERT INTO prodotti (codice, nome, kg_per_vaschetta, giacenza_iniziale_vaschette)
+        VALUES (?, ?, ?, ?)
+        """,
+        [(str(1000 + i), f"Prodotto {i:03d}", kg_v[i], rnd.randint(0, 200)) for i in range(prodotti)],
+    )
+
+    cur.execute("SELECT id FROM clienti")
+    id_clienti = [r[0] for r in cur.fetchall()]
+    cur.execute("SELECT id, kg_per_vaschetta FROM prodotti")
+    id_prodotti = cur.fetchall()
+
+    oggi = date.today()
+    for n in range(giorni - 1, -1, -1):
+        d = oggi - timedelta(days=n)
+        data_iso, giorno = d.isoformat(), giorno_da_data(d)
+
+        cur.executemany(
+            "INSERT INTO produzione (data, giorno, prodotto_id, vaschette_prodotte) VALUES (?, ?, ?, ?)",
+            [(data_iso, giorno, p["id"], rnd.randint(20, 120)) for p in id_prodotti],
+        )
+
+        for cliente_id in rnd.sample(id_clienti, min(ordini_giorno, len(id_clienti))):
+            cur.execute(
+                "INSERT INTO ordini (data, giorno, cliente_id) VALUES (?, ?, ?)",
+                (data_iso, giorno, cliente_id),
+            )
+            ordine_id = cur.lastrowid
+
+            righe = []
+            for p in rnd.sample(id_prodotti, min(righe_ordine, len(id_prodotti))):
+                tipo = rnd.choice(("kg", "v"))
+                qta = float(rnd.randint(1, 20))
+                kg, vaschette = converti_qta(qta, tipo, p["kg_per_vaschetta"])
+                righe.append((ordine_id, p["id"], qta, tipo, kg, vaschette))
+
+            cur.executemany(
+                "INSERT INTO righe_ordine (ordine_id, prodotto_id, qta_inserita, tipo_qta, kg, vaschette) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                righe,
+            )
+
+    conn.commit()
+    conn.close()
+
+    # seconda passata di init_db: lotti, scadenze e assegnazioni dei dati
+    # appena inseriti vengono calcolati dalle stesse migrazioni del gestionale
+    gestionale.DB_PATH = percorso
+    try:
+        gestionale.init_db()
+    finally:
+        gestionale.DB_PATH = db_path_originale
+    return percorso
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un database di prova.")
+    parser.add_argument("percorso")
+    parser.add_argument("--clienti", type=int, default=150)
+    parser.add_argument("--prodotti", type=int, default=60)
+    parser.add_argument("--giorni", type=int, default=90)
+    parser.add_argument("--ordini-giorno", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if os.path.abspath(args.percorso) == os.path.abspath("gestionale.db"):
+        parser.error("non sovrascrivo il database reale gestionale.db")
+
+    genera_database(
+        args.percorso,
+        clienti=args.clienti,
+        prodotti=args.prodotti,
+        giorni=args.giorni,
+        ordini_giorno=args.ordini_giorno,
+        seed=args.seed,
+    )
+    print(f"Database di prova creato: {args.percorso}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Etichette PDF per il carico dei furgoni: una per cliente, ordine e
+prodotto, con vaschette, kg e codice a barre Code128.
+
+Il foglio è A4 con 2 x 4 etichette da 105 x 74 mm (fogli adesivi
+standard). reportlab viene importato solo quando si importa questo
+modulo, cioè alla prima stampa (vedi app.precarica_librerie_stampa).
+"""
+
+import io
+
+from reportlab.graphics.barcode.code128 import Code128
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+COLONNE = 2
+RIGHE = 4
+MARGINE = 5 * mm  # bordo interno dell'etichetta
+
+LARGHEZZA = A4[0] / COLONNE
+ALTEZZA = A4[1] / RIGHE
+
+
+def codice_etichetta(ordine_id, prodotto_id):
+    """Valore del codice a barre: ordine e prodotto (solo caratteri ASCII)."""
+    return f"O{ordine_id}P{prodotto_id}"
+
+
+def _taglia(testo, font, corpo, larghezza):
+    """Accorcia il testo con "..." finché non entra nella larghezza."""
+    if stringWidth(testo, font, corpo) <= larghezza:
+        return testo
+    while testo and stringWidth(testo + "...", font, corpo) > larghezza:
+        testo = testo[:-1]
+    return testo + "..."
+
+
+def _disegna(c, x, y, e):
+    utile = LARGHEZZA - 2 * MARGINE
+    sinistra = x + MARGINE
+    alto = y + ALTEZZA - MARGINE
+
+    c.rect(x + 2 * mm, y + 2 * mm, LARGHEZZA - 4 * mm, ALTEZZA - 4 * mm)
+
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(sinistra, alto - 12, _taglia(e["cliente_nome"], "Helvetica-Bold", 14, utile))
+
+    c.setFont("Helvetica", 9)
+    riga = f"Ordine n. {e['ordine_id']} - {e['data']}"
+    if e["cliente_codice"]:
+        riga = f"Cliente {e['cliente_codice']} - " + riga
+    c.drawString(sinistra, alto - 26, _taglia(riga, "Helvetica", 9, utile))
+
+    prodotto = e["prodotto_nome"]
+    if e["prodotto_codice"]:
+        prodotto = f"[{e['prodotto_codice']}] {prodotto}"
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(sinistra, alto - 46, _taglia(prodotto, "Helvetica-Bold", 12, utile))
+
+    c.setFont("Helvetica", 12)
+    c.drawString(sinistra, alto - 64, f"Vaschette: {e['vaschette']:.2f}")
+    c.drawString(sinistra + utile / 2, alto - 64, f"Kg: {e['kg']:.2f}")
+
+    valore = codice_etichetta(e["ordine_id"], e["prodotto_id"])
+    barcode = Code128(valore, barHeight=14 * mm, barWidth=0.4 * mm, humanReadable=True)
+    barcode.drawOn(c, sinistra - barcode.lquiet, y + MARGINE + 4)
+
+
+def crea_pdf(etichette, titolo="Etichette"):
+    """
+    etichette: righe con ordine_id, data, cliente_nome, cliente_codice,
+    prodotto_id, prodotto_nome, prodotto_codice, vaschette, kg.
+    Ritorna il PDF (BytesIO, già riavvolto).
+    """
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    c.setTitle(titolo)
+
+    per_pagina = COLONNE * RIGHE
+    for i, e in enumerate(etichette):
+        if i and i % per_pagina == 0:
+            c.showPage()
+        posto = i % per_pagina
+        x = (posto % COLONNE) * LARGHEZZA
+        y = A4[1] - (posto // COLONNE + 1) * ALTEZZA
+        _disegna(c, x, y, e)
+
+    c.save()
+    buffer.seek(0)
+    return buffer
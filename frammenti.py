@@ -0,0 +1,69 @@
+"""
+Cache dei frammenti HTML delle tabelle grandi (ordini, magazzino,
+produzione, statistiche).
+
+Ogni frammento è legato alla "versione" delle tabelle da cui dipende,
+letta dal registro `modifiche`: l'ultimo seq registrato per tabella cambia
+a ogni INSERT/UPDATE/DELETE, quindi finché la versione è la stessa si
+riusa l'HTML già pronto senza rifare né la query né il rendering.
+
+La cache è nel processo (un dizionario per worker): la versione si legge
+dal database, quindi più worker restano coerenti tra loro.
+"""
+
+import threading
+
+from markupsafe import Markup
+
+from modifiche import TABELLE_TRACCIATE
+
+# frammenti tenuti in memoria per worker (i più vecchi escono per primi)
+MAX_FRAMMENTI = 64
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def versione(cur, tabelle):
+    """
+    Chiave di versione delle tabelle indicate: per quelle tracciate l'ultimo
+    seq del registro (indice idx_modifiche_tabella), per `allocazioni` il
+    contatore AUTOINCREMENT, che cresce a ogni nuova assegnazione di lotti.
+
+    Le assegnazioni cambiano il residuo dei lotti (residuo_v, escluso dal
+    registro); le si toglie solo cancellando righe d'ordine, che invece
+    sono registrate.
+    """
+    parti = []
+    params = []
+    for tabella in tabelle:
+        if tabella in TABELLE_TRACCIATE:
+            parti.append("(SELECT MAX(seq) FROM modifiche WHERE tabella = ?)")
+        elif tabella == "allocazioni":
+            parti.append("(SELECT seq FROM sqlite_sequence WHERE name = ?)")
+        else:
+            raise ValueError(f"Tabella senza versione: {tabella}")
+        params.append(tabella)
+    cur.execute(f"SELECT {', '.join(parti)}", params)
+    return tuple(cur.fetchone())
+
+
+def frammento(nome, versione, crea, parametri=()):
+    """
+    HTML del frammento `nome` (per i `parametri` della pagina, es. un
+    intervallo di date): se in cache c'è quello della stessa `versione` lo
+    riusa, altrimenti lo genera con crea() e sostituisce il vecchio.
+    """
+    posto = (nome, parametri)
+    voce = _cache.get(posto)
+    if voce is not None and voce[0] == versione:
+        return voce[1]
+
+    html = Markup(crea())
+    with _lock:
+        _cache.pop(posto, None)
+        _cache[posto] = (versione, html)
+        while len(_cache) > MAX_FRAMMENTI:
+            del _cache[next(iter(_cache))]
+    return html
+
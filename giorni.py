@@ -0,0 +1,51 @@
+"""
+Chiave intera dei giorni (AAAAMMGG) usata per indicizzare ordini e produzione.
+
+Le date arrivano dai form come testo: qui vengono validate (solo ISO
+AAAA-MM-GG) e convertite nella chiave intera salvata nella colonna
+`giorno`, così ogni filtro per data diventa una ricerca per intervallo
+sull'indice.
+"""
+
+from datetime import date, datetime, timedelta
+
+GIORNO_MIN = 0
+GIORNO_MAX = 99991231
+
+
+def leggi_data(testo):
+    """
+    Converte una data ISO (AAAA-MM-GG) in `date`.
+    Solleva ValueError se il testo non è una data valida.
+    """
+    return datetime.strptime((testo or "").strip(), "%Y-%m-%d").date()
+
+
+def giorno_da_data(d):
+    """date -> chiave intera AAAAMMGG."""
+    return d.year * 10000 + d.month * 100 + d.day
+
+
+def data_da_giorno(giorno):
+    """Chiave intera AAAAMMGG -> date."""
+    return date(giorno // 10000, giorno // 100 % 100, giorno % 100)
+
+
+def giorno_da_testo(testo):
+    """Data ISO in testo -> chiave intera. Solleva ValueError se non valida."""
+    return giorno_da_data(leggi_data(testo))
+
+
+def intervallo(dal=None, al=None):
+    """
+    Restituisce (giorno_inizio, giorno_fine) inclusivi a partire da due
+    date ISO opzionali; un estremo mancante lascia l'intervallo aperto.
+    """
+    inizio = giorno_da_testo(dal) if dal else GIORNO_MIN
+    fine = giorno_da_testo(al) if al else GIORNO_MAX
+    return inizio, fine
+
+
+def aggiungi_giorni(giorno, n):
+    """Sposta una chiave AAAAMMGG di n giorni."""
+    return giorno_da_data(data_da_giorno(giorno) + timedelta(days=n))
@@ -0,0 +1,134 @@
+"""
+Lotti di produzione con scadenza e assegnazione FEFO alle righe d'ordine.
+
+Ogni registrazione di produzione è un lotto con `residuo_v` vaschette
+ancora libere. Le righe d'ordine hanno `da_allocare_v` vaschette ancora da
+coprire: l'assegnazione prende i lotti aperti del prodotto in ordine di
+scadenza (prima scade, prima esce) e scrive le quote in `allocazioni`.
+
+I lotti aperti si leggono dall'indice parziale idx_lotti_aperti
+(solo residuo_v > 0), a partire dalla scadenza del primo giorno di
+consegna: i lotti già scaduti restano nell'indice ma non vengono letti.
+Dopo una nuova produzione si riprovano solo le righe con consegna nella
+vita del lotto, quindi né l'una né l'altra cosa rilegge tutto lo storico.
+"""
+
+from giorni import aggiungi_giorni
+
+GIORNI_SCADENZA_DEFAULT = 30
+
+# lotti mostrati "in scadenza" in magazzino
+GIORNI_AVVISO_SCADENZA = 3
+
+EPSILON_V = 1e-9
+
+
+def scadenza_default(giorno, giorni_scadenza):
+    """Chiave AAAAMMGG di scadenza per un lotto prodotto il `giorno`."""
+    return aggiungi_giorni(giorno, giorni_scadenza or GIORNI_SCADENZA_DEFAULT)
+
+
+def _lotti_aperti(cur, prodotto_id, dal_giorno):
+    """Lotti del prodotto con vaschette libere, non scaduti il `dal_giorno`."""
+    cur.execute(
+        """
+        SELECT id, COALESCE(giorno, 0) AS giorno, scadenza_giorno, residuo_v
+        FROM produzione
+        WHERE prodotto_id = ? AND residuo_v > 0 AND scadenza_giorno >= ?
+        ORDER BY scadenza_giorno, id
+        """,
+        (prodotto_id, dal_giorno),
+    )
+    # [id, giorno, scadenza_giorno, residuo_v, residuo_v iniziale]
+    return [[*r, r["residuo_v"]] for r in cur.fetchall()]
+
+
+def alloca_righe(cur, righe):
+    """
+    Assegna i lotti alle righe indicate, FEFO.
+
+    righe: [(riga_id, prodotto_id, giorno_consegna, da_allocare_v)] già
+    ordinate per consegna. Un lotto è utilizzabile se prodotto entro il
+    giorno di consegna e non ancora scaduto in quel giorno.
+    Ritorna le vaschette assegnate in totale.
+    """
+    lotti = {}  # prodotto_id -> lotti aperti, vedi _lotti_aperti
+    allocazioni = []
+    righe_aggiornate = []
+    totale = 0.0
+
+    for riga_id, prodotto_id, giorno, da_allocare in righe:
+        giorno = giorno or 0
+        if prodotto_id not in lotti:
+            # righe ordinate per consegna: la prima del prodotto è la più vicina
+            lotti[prodotto_id] = _lotti_aperti(cur, prodotto_id, giorno)
+
+        da_allocare_iniziale = da_allocare
+        for lotto in lotti[prodotto_id]:
+            if da_allocare <= EPSILON_V:
+                break
+            lotto_id, lotto_giorno, scadenza, residuo, _ = lotto
+            if residuo <= EPSILON_V or lotto_giorno > giorno or (scadenza or 0) < giorno:
+                continue
+
+            quota = min(residuo, da_allocare)
+            lotto[3] -= quota
+            da_allocare -= quota
+            totale += quota
+            allocazioni.append((riga_id, lotto_id, quota))
+
+        if da_allocare != da_allocare_iniziale:
+            righe_aggiornate.append((max(da_allocare, 0.0), riga_id))
+
+    cur.executemany(
+        "INSERT INTO allocazioni (riga_ordine_id, produzione_id, vaschette) VALUES (?, ?, ?)",
+        allocazioni,
+    )
+    cur.executemany(
+        "UPDATE produzione SET residuo_v = ? WHERE id = ?",
+        [(l[3], l[0]) for elenco in lotti.values() for l in elenco if l[3] != l[4]],
+    )
+    cur.executemany(
+        "UPDATE righe_ordine SET da_allocare_v = ? WHERE id = ?",
+        righe_aggiornate,
+    )
+    return totale
+
+
+def _alloca_query(cur, filtro, params):
+    cur.execute(
+        f"""
+        SELECT ro.id, ro.prodotto_id, o.giorno, ro.da_allocare_v
+        FROM ordini o
+        JOIN righe_ordine ro ON ro.ordine_id = o.id
+        WHERE ro.da_allocare_v > 0 AND {filtro}
+        ORDER BY o.giorno, o.id, ro.id
+        """,
+        params,
+    )
+    return alloca_righe(cur, [tuple(r) for r in cur.fetchall()])
+
+
+def alloca_ordine(cur, ordine_id):
+    return _alloca_query(cur, "o.id = ?", (ordine_id,))
+
+
+def alloca_giorno(cur, giorno):
+    return _alloca_query(cur, "o.giorno = ?", (giorno,))
+
+
+def alloca_prodotto(cur, prodotto_id, dal_giorno, al_giorno):
+    """
+    Righe ancora scoperte di un prodotto con consegna tra `dal_giorno` e
+    `al_giorno` (dopo una nuova produzione: dal giorno del lotto alla sua
+    scadenza, le altre righe il lotto non le può coprire).
+    """
+    return _alloca_query(
+        cur, "ro.prodotto_id = ? AND o.giorno BETWEEN ? AND ?", (prodotto_id, dal_giorno, al_giorno)
+    )
+
+
+def alloca_tutto(cur):
+    """Tutte le righe scoperte, dalla consegna più vecchia (usata in migrazione)."""
+    return _alloca_query(cur, "1 = 1", ())
+
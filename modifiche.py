@@ -0,0 +1,154 @@
+"""
+Registro delle modifiche (change data capture) per la sincronizzazione
+incrementale con il gestionale contabile.
+
+Ogni INSERT/UPDATE/DELETE sulle tabelle tracciate viene scritto da un
+trigger nella tabella `modifiche`, con un numero di sequenza crescente.
+Chi sincronizza conserva l'ultimo `seq` ricevuto e chiede solo quelli
+successivi (vedi leggi_modifiche).
+
+Le righe che esistevano prima del registro, e quelle cambiate dalle
+migrazioni (che non passano dai trigger), vengono scritte da
+registra_esistenti: partendo da seq 0 si ricostruisce quindi tutto lo
+stato attuale.
+"""
+
+TABELLE_TRACCIATE = ("clienti", "prodotti", "ordini", "righe_ordine", "produzione")
+
+# colonne di servizio (assegnazione lotti): non sono dati da sincronizzare
+COLONNE_ESCLUSE = {
+    "produzione": ("residuo_v",),
+    "righe_ordine": ("da_allocare_v",),
+}
+
+OPERAZIONI = (
+    ("I", "INSERT", "NEW"),
+    ("U", "UPDATE", "NEW"),
+    ("D", "DELETE", "OLD"),
+)
+
+LIMITE_MAX = 10000
+
+
+def crea_tabella(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS modifiche (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabella TEXT NOT NULL,
+            operazione TEXT NOT NULL, -- 'I', 'U' oppure 'D'
+            riga_id INTEGER NOT NULL,
+            dati TEXT,                -- riga in JSON (OLD per le cancellazioni)
+            creato_il TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+        )
+        """
+    )
+    # ultimo seq per tabella (versione usata dalla cache dei frammenti)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_modifiche_tabella ON modifiche(tabella, seq)")
+
+
+def elimina_trigger(cur):
+    for tabella in TABELLE_TRACCIATE:
+        for op, _, _ in OPERAZIONI:
+            cur.execute(f"DROP TRIGGER IF EXISTS modifiche_{tabella}_{op.lower()}")
+
+
+def _colonne(cur, tabella):
+    """Colonne sincronizzate della tabella, dallo schema attuale."""
+    cur.execute(f"PRAGMA table_info({tabella})")
+    escluse = COLONNE_ESCLUSE.get(tabella, ())
+    return [r[1] for r in cur.fetchall() if r[1] not in escluse]
+
+
+def _json_riga(colonne, riga):
+    """json_object(...) delle colonne di `riga` (NEW, OLD o l'alias di una SELECT)."""
+    campi = ", ".join(f"'{c}', {riga}.{c}" for c in colonne)
+    return f"json_object({campi})"
+
+
+def crea_trigger(cur):
+    """
+    (Ri)crea i trigger di tutte le tabelle tracciate. Le colonne vengono
+    lette dallo schema attuale, quindi va chiamata dopo le migrazioni.
+    """
+    elimina_trigger(cur)
+
+    for tabella in TABELLE_TRACCIATE:
+        colonne = _colonne(cur, tabella)
+
+        for op, evento, riga in OPERAZIONI:
+            if op == "U" and tabella in COLONNE_ESCLUSE:
+                # gli UPDATE delle sole colonne escluse non vengono registrati
+                evento = f"UPDATE OF {', '.join(colonne)}"
+            cur.execute(
+                f"""
+                CREATE TRIGGER modifiche_{tabella}_{op.lower()}
+                AFTER {evento} ON {tabella}
+                BEGIN
+                    INSERT INTO modifiche (tabella, operazione, riga_id, dati)
+                    VALUES ('{tabella}', '{op}', {riga}.id, {_json_riga(colonne, riga)});
+                END
+                """
+            )
+
+
+def registra_esistenti(cur, cambiate=()):
+    """
+    Scrive nel registro le righe che i trigger non hanno visto:
+    'I' per ogni riga non ancora presente (dati precedenti al registro) e
+    'U' per le righe già registrate delle tabelle in `cambiate` (modificate
+    da una migrazione). Va chiamata dopo le migrazioni, con le colonne
+    definitive; senza righe nuove né migrazioni non scrive niente.
+    """
+    for tabella in TABELLE_TRACCIATE:
+        dati = _json_riga(_colonne(cur, tabella), "t")
+        gia_registrate = "SELECT riga_id FROM modifiche WHERE tabella = ?"
+        if tabella in cambiate:
+            cur.execute(
+                f"""
+                INSERT INTO modifiche (tabella, operazione, riga_id, dati)
+                SELECT ?, 'U', t.id, {dati} FROM {tabella} t
+                WHERE t.id IN ({gia_registrate})
+                ORDER BY t.id
+                """,
+                (tabella, tabella),
+            )
+        cur.execute(
+            f"""
+            INSERT INTO modifiche (tabella, operazione, riga_id, dati)
+            SELECT ?, 'I', t.id, {dati} FROM {tabella} t
+            WHERE t.id NOT IN ({gia_registrate})
+            ORDER BY t.id
+            """,
+            (tabella, tabella),
+        )
+
+
+def leggi_modifiche(conn, dopo=0, limite=1000):
+    """
+    Restituisce le modifiche con seq > dopo, in ordine, come righe JSON
+    già pronte (una per modifica) e l'ultimo seq letto.
+    """
+    limite = max(1, min(int(limite), LIMITE_MAX))
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT seq,
+               json_object(
+                   'seq', seq,
+                   'tabella', tabella,
+                   'operazione', operazione,
+                   'id', riga_id,
+                   'dati', json(dati),
+                   'creato_il', creato_il
+               ) AS riga
+        FROM modifiche
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+        """,
+        (int(dopo), limite),
+    )
+    righe = cur.fetchall()
+    ultimo = righe[-1][0] if righe else int(dopo)
+    return [r[1] for r in righe], ultimo
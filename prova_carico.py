@@ -0,0 +1,253 @@
+"""
+Prova di carico: simula il picco di ordini del mattino sulle route reali
+(/ordini/nuovo in POST, /magazzino, /ordini, /ordini/stampa_giorno) con
+più utenti contemporanei, e riporta richieste al secondo, percentili di
+latenza ed errori (compresi i "database is locked" di SQLite).
+
+Senza --url genera un database di prova in una cartella temporanea e
+avvia il gestionale in locale su una porta libera: gira tutto offline e
+non tocca gestionale.db.
+
+Uso:
+    py prova_carico.py [--utenti 20] [--durata 30] [--mix nuovo=40,magazzino=20,ordini=30,stampa=10]
+    py prova_carico.py --url http://127.0.0.1:5000 --durata 60
+"""
+
+import argparse
+import http.client
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from urllib.parse import urlencode, urlsplit
+
+MIX_DEFAULT = "nuovo=40,magazzino=20,ordini=30,stampa=10"
+
+
+# ---------------------- SERVER LOCALE ----------------------
+
+
+class ServerLocale:
+    """Gestionale avviato in un thread su un database di prova."""
+
+    def __init__(self, percorso_db):
+        from flask import got_request_exception
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        import app as gestionale
+
+        gestionale.DB_PATH = percorso_db
+        self.errori_lock = 0
+        self._lock = threading.Lock()
+        got_request_exception.connect(self._eccezione, gestionale.app, weak=False)
+
+        class SenzaLog(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server(
+            "127.0.0.1", 0, gestionale.app, threaded=True, request_handler=SenzaLog
+        )
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def _eccezione(self, sender, exception, **extra):
+        if "locked" in str(exception):
+            with self._lock:
+                self.errori_lock += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+
+
+# ---------------------- CLIENT ----------------------
+
+
+def richiesta(url, metodo, percorso, corpo=None):
+    """Esegue una richiesta senza seguire i redirect. Ritorna (status, location, secondi)."""
+    parti = urlsplit(url)
+    conn = http.client.HTTPConnection(parti.hostname, parti.port or 80, timeout=60)
+    headers = {}
+    if corpo is not None:
+        corpo = urlencode(corpo)
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+    t0 = time.perf_counter()
+    try:
+        conn.request(metodo, percorso, body=corpo, headers=headers)
+        risposta = conn.getresponse()
+        risposta.read()
+        return risposta.status, risposta.getheader("Location") or "", time.perf_counter() - t0
+    finally:
+        conn.close()
+
+
+def leggi_anagrafiche(url):
+    """Id di clienti e prodotti, letti dal form di nuovo ordine."""
+    parti = urlsplit(url)
+    conn = http.client.HTTPConnection(parti.hostname, parti.port or 80, timeout=60)
+    conn.request("GET", "/ordini/nuovo")
+    html = conn.getresponse().read().decode("utf-8")
+    conn.close()
+
+    form, script = html.split("<script>", 1)
+    clienti = re.findall(r'<option value="(\d+)">', form)
+    prodotti = sorted(set(re.findall(r'<option value="(\d+)">', script)))
+    if not clienti or not prodotti:
+        raise SystemExit("Nessun cliente o prodotto nel gestionale: niente da simulare.")
+    return clienti, prodotti
+
+
+def leggi_mix(testo):
+    mix = {}
+    for parte in testo.split(","):
+        nome, peso = parte.split("=")
+        if nome not in OPERAZIONI:
+            raise SystemExit(f"Operazione sconosciuta nel mix: {nome}")
+        mix[nome] = float(peso)
+    return mix
+
+
+# ---------------------- OPERAZIONI ----------------------
+
+
+def op_nuovo(url, rnd, ctx):
+    corpo = {"data": ctx["data"], "cliente_id": rnd.choice(ctx["clienti"])}
+    for i, prodotto_id in enumerate(rnd.sample(ctx["prodotti"], min(6, len(ctx["prodotti"])))):
+        corpo[f"prodotto_{i}"] = prodotto_id
+        corpo[f"qta_{i}"] = str(rnd.randint(1, 20))
+        corpo[f"tipo_{i}"] = rnd.choice(("kg", "v"))
+    status, location, secondi = richiesta(url, "POST", "/ordini/nuovo", corpo)
+    # salvato = redirect alla lista ordini; errore = redirect di nuovo al form
+    return status == 302 and location.rstrip("/").endswith("/ordini"), status, secondi
+
+
+def op_magazzino(url, rnd, ctx):
+    status, _, secondi = richiesta(url, "GET", "/magazzino")
+    return status == 200, status, secondi
+
+
+def op_ordini(url, rnd, ctx):
+    status, _, secondi = richiesta(url, "GET", "/ordini")
+    return status == 200, status, secondi
+
+
+def op_stampa(url, rnd, ctx):
+    status, _, secondi = richiesta(url, "GET", f"/ordini/stampa_giorno?data={ctx['data']}")
+    return status == 200, status, secondi
+
+
+OPERAZIONI = {
+    "nuovo": op_nuovo,
+    "magazzino": op_magazzino,
+    "ordini": op_ordini,
+    "stampa": op_stampa,
+}
+
+
+# ---------------------- ESECUZIONE ----------------------
+
+
+def percentile(valori, p):
+    """Percentile con metodo nearest-rank su una lista già ordinata."""
+    if not valori:
+        return 0.0
+    k = max(0, min(len(valori) - 1, math.ceil(p / 100 * len(valori)) - 1))
+    return valori[k]
+
+
+def esegui(url, utenti, durata, mix, ctx, seed):
+    nomi = list(mix)
+    pesi = [mix[n] for n in nomi]
+    risultati = defaultdict(list)  # nome -> [(ok, status, secondi)]
+    lock = threading.Lock()
+    fine = time.perf_counter() + durata
+
+    def utente(n):
+        rnd = random.Random(seed + n)
+        while time.perf_counter() < fine:
+            nome = rnd.choices(nomi, pesi)[0]
+            try:
+                esito = OPERAZIONI[nome](url, rnd, ctx)
+            except OSError:
+                esito = (False, 0, 0.0)
+            with lock:
+                risultati[nome].append(esito)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=utente, args=(n,)) for n in range(utenti)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return risultati, time.perf_counter() - t0
+
+
+def stampa_rapporto(risultati, secondi, errori_lock):
+    totale = sum(len(v) for v in risultati.values())
+    errori = sum(1 for v in risultati.values() for ok, _, _ in v if not ok)
+
+    print(f"\nRichieste: {totale} in {secondi:.1f} s  ->  {totale / secondi:.1f} req/s")
+    print(f"{'operazione':<11}{'n':>7}{'errori':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for nome, esiti in sorted(risultati.items()):
+        tempi = sorted(s * 1000 for _, _, s in esiti)
+        err = sum(1 for ok, _, _ in esiti if not ok)
+        print(
+            f"{nome:<11}{len(esiti):>7}{err:>8}"
+            f"{percentile(tempi, 50):>9.1f}{percentile(tempi, 95):>9.1f}"
+            f"{percentile(tempi, 99):>9.1f}{(tempi[-1] if tempi else 0):>9.1f}"
+        )
+
+    print(f"\nErrori totali: {errori} ({100 * errori / max(totale, 1):.2f}%)")
+    if errori_lock is None:
+        print("Errori 'database is locked': n/d (server esterno)")
+    else:
+        print(f"Errori 'database is locked': {errori_lock} ({100 * errori_lock / max(totale, 1):.2f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prova di carico del gestionale.")
+    parser.add_argument("--url", help="Server già avviato (default: server locale su DB di prova)")
+    parser.add_argument("--utenti", type=int, default=20, help="Utenti contemporanei")
+    parser.add_argument("--durata", type=float, default=30, help="Durata in secondi")
+    parser.add_argument("--mix", default=MIX_DEFAULT, help="Pesi delle operazioni")
+    parser.add_argument("--data", default=date.today().isoformat(), help="Data degli ordini e delle stampe")
+    parser.add_argument("--giorni", type=int, default=60, help="Giorni di storico nel DB di prova")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    mix = leggi_mix(args.mix)
+
+    if args.url:
+        clienti, prodotti = leggi_anagrafiche(args.url)
+        ctx = {"data": args.data, "clienti": clienti, "prodotti": prodotti}
+        risultati, secondi = esegui(args.url, args.utenti, args.durata, mix, ctx, args.seed)
+        stampa_rapporto(risultati, secondi, None)
+        return
+
+    from dati_prova import genera_database
+
+    with tempfile.TemporaryDirectory() as cartella:
+        percorso = os.path.join(cartella, "prova_carico.db")
+        print(f"Genero il database di prova ({args.giorni} giorni)...")
+        genera_database(percorso, giorni=args.giorni, seed=args.seed)
+
+        with ServerLocale(percorso) as server:
+            clienti, prodotti = leggi_anagrafiche(server.url)
+            ctx = {"data": args.data, "clienti": clienti, "prodotti": prodotti}
+            print(f"Server su {server.url}: {args.utenti} utenti per {args.durata:.0f} s")
+            risultati, secondi = esegui(server.url, args.utenti, args.durata, mix, ctx, args.seed)
+            stampa_rapporto(risultati, secondi, server.errori_lock)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Conversione delle quantità d'ordine tra kg e vaschette.
+
+Le righe d'ordine salvano kg e vaschette già calcolati al momento
+dell'inserimento: questo è l'unico posto in cui vive la regola, sia in
+Python (inserimento da form) sia in SQL (backfill e copie INSERT ... SELECT).
+"""
+
+TIPI_QTA = ("kg", "v")
+
+
+def converti_qta(qta, tipo_qta, kg_per_vaschetta):
+    """
+    Restituisce (kg, vaschette) per una quantità inserita in kg ('kg')
+    oppure in vaschette ('v').
+    """
+    kg_v = kg_per_vaschetta or 0
+
+    if tipo_qta == "kg":
+        return qta, (qta / kg_v if kg_v > 0 else 0)
+    return qta * kg_v, qta
+
+
+def sql_kg(qta="qta_inserita", tipo="tipo_qta", kg_v="kg_per_vaschetta"):
+    """Espressione SQL equivalente a converti_qta(...)[0]."""
+    return f"(CASE WHEN {tipo} = 'kg' THEN {qta} ELSE {qta} * COALESCE({kg_v}, 0) END)"
+
+
+def sql_vaschette(qta="qta_inserita", tipo="tipo_qta", kg_v="kg_per_vaschetta"):
+    """Espressione SQL equivalente a converti_qta(...)[1]."""
+    return (
+        f"(CASE WHEN {tipo} = 'kg' "
+        f"THEN (CASE WHEN COALESCE({kg_v}, 0) > 0 THEN {qta} / {kg_v} ELSE 0 END) "
+        f"ELSE {qta} END)"
+    )